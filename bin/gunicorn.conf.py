@@ -0,0 +1,10 @@
+import threading
+
+
+def post_worker_init(worker):
+    # Warm up in the background: the worker has to start heartbeating within
+    # the timeout, meanwhile /ready reports it isn't ready
+    from rmhub.web import warmup
+    thread = threading.Thread(target=warmup)
+    thread.daemon = True
+    thread.start()
@@ -1,2 +1,2 @@
 #!/bin/bash
-gunicorn rmhub.web:app -k eventlet -t 5 -b 0.0.0.0:8000 --log-file -
+gunicorn rmhub.web:app -c bin/gunicorn.conf.py -k eventlet -t 5 -b 0.0.0.0:8000 --log-file -
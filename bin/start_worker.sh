@@ -1,2 +1,4 @@
 #!/bin/bash
-rq worker --url $QUEUE_REDIS_URL
+# The worker runs jobs in its own process, so the hub and its connections outlive single jobs,
+# and warms them up before taking any
+rq worker --worker-class rmhub.worker.Worker --url $QUEUE_REDIS_URL
@@ -1,21 +1,32 @@
 import hashlib
+import itertools
 import json
 import logging
 import os
+import random
 import re
-from datetime import datetime
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+from multiprocessing.pool import ThreadPool
 
 from dotenv import find_dotenv, load_dotenv
-from github import Github, InputGitTreeElement, enable_console_debug_logging, UnknownObjectException
-from redis import ConnectionPool, Redis, StrictRedis
+from github import (Github, GithubException, InputGitTreeElement, RateLimitExceededException,
+                    enable_console_debug_logging, UnknownObjectException)
+from github.Repository import Repository as GithubRepo
+from github.Requester import Requester
+from redis import ConnectionPool, Redis, RedisError, ResponseError, StrictRedis
+from redis.exceptions import ConnectionError, TimeoutError
 from redisearch import Client as RediSearchClient
-from redisearch import (AutoCompleter, NumericField, Query, SortbyField,
-                        Suggestion, TextField)
+from redisearch import AutoCompleter, NumericField, Query, SortbyField, TextField
 from rejson import Client as ReJSONClient
 from rejson import Path
-from rq import Queue
-from rq_scheduler import Scheduler
 
+import metrics
 from stopwords import stopwords
 
 logging.basicConfig(level=logging.INFO,
@@ -24,38 +35,318 @@ logger = logging.getLogger(__name__)
 
 load_dotenv(find_dotenv())
 
-# TODO:
-# * Interactions with gh fail on SSL, timeouts... - need to devise a way to deal w/ that
+# Count and time the calls to Github's API
+Requester.injectConnectionClasses(metrics.httplib.HTTPConnection, metrics.InstrumentedHTTPSConnection)
 
 def _durationms(func, *args, **kwargs):
-    start = datetime.now()
+    start = metrics.clock()
     res = func(*args, **kwargs)
-    return res, (datetime.now() - start).total_seconds() * 1000.0
+    return res, (metrics.clock() - start) * 1000.0
 
 def _toepoch(ts):
     return (ts - datetime(1970,1,1)).total_seconds()
 
+# Process-wide registries of connections and Github clients, shared by hubs
+_connections = {}
+_githubs = {}
+
+def _connection(url, cls=StrictRedis, service='redis'):
+    key = (cls, url)
+    if key not in _connections:
+        pool = ConnectionPool.from_url(url)
+        # Instrument the connection class the URL's scheme calls for
+        pool.connection_class = metrics.instrumented(pool.connection_class)
+        pool.connection_kwargs['service'] = service
+        _connections[key] = cls(connection_pool=pool)
+    return _connections[key]
+
+def _github(login_or_token):
+    if login_or_token not in _githubs:
+        _githubs[login_or_token] = Github(login_or_token)
+    return _githubs[login_or_token]
+
+def _queue(conn, name='default'):
+    # The queue and the scheduler are only imported by the roles using them
+    from rq import Queue
+    return Queue(name, connection=conn)
+
+def _scheduler(conn):
+    from rq_scheduler import Scheduler
+    return Scheduler(connection=conn)
+
+def _retried(func, *args, **kwargs):
+    """
+    Calls ``func``, retrying transient Github failures (network errors and
+    server errors) up to ``retries`` times with bounded exponential backoff
+    """
+    retries = kwargs.pop('retries', 4)
+    for attempt in range(retries):
+        try:
+            return func(*args, **kwargs)
+        except (IOError, metrics.httplib.HTTPException, GithubException) as e:
+            if isinstance(e, GithubException) and e.status < 500:
+                raise
+            if attempt == retries - 1:
+                raise
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning('Github call failed, retrying in {:.1f}s: {}'.format(delay, e))
+            time.sleep(delay)
+
+class GithubQuotaError(Exception):
+    """
+    Raised when none of the pool's tokens has quota left for the work, which
+    can be retried once the quota resets at the ``reset`` epoch
+    """
+    def __init__(self, reset):
+        Exception.__init__(self, 'Github quota exhausted until {}'.format(reset))
+        self.reset = reset
+
+class GithubPool(object):
+    """
+    Github clients of a pool of tokens that share their remaining quota
+    through Redis. Low priority work (e.g. stats refreshes) only gets a client
+    while one has more than ``reserve`` requests left, keeping them for
+    user-facing work like submissions.
+    """
+    _key = 'ghquota'
+
+    def __init__(self, conn, clients, reserve=500):
+        self._conn = conn
+        self._clients = clients     # Github clients by token id
+        self.reserve = reserve
+
+    @classmethod
+    def of(cls, conn, tokens, **kwargs):
+        clients = OrderedDict()
+        for token in tokens:
+            clients[hashlib.sha1(token.encode('utf-8')).hexdigest()[:12]] = _github(token)
+        return cls(conn, clients, **kwargs)
+
+    @property
+    def default(self):
+        return next(iter(self._clients.values()), None)
+
+    def quotas(self):
+        """
+        Returns the remaining requests and reset epoch of every token,
+        remaining is None if unknown or already reset
+        """
+        ids = list(self._clients)
+        quotas = {}
+        now = time.time()
+        for token_id, value in zip(ids, self._conn.hmget(self._key, ids) if ids else []):
+            quota = json.loads(value) if value else None
+            if quota is None or quota['reset'] <= now:
+                quota = {'remaining': None, 'reset': 0}
+            quotas[token_id] = quota
+        return quotas
+
+    def acquire(self, low=False):
+        """
+        Returns the id and client of the token that has the most quota left
+        """
+        quotas = self.quotas()
+        if not quotas:
+            raise RuntimeError('No Github tokens')
+        def left(token_id):
+            remaining = quotas[token_id]['remaining']
+            return float('inf') if remaining is None else remaining
+        token_id = max(quotas, key=left)
+        if left(token_id) <= (self.reserve if low else 0):
+            raise GithubQuotaError(min(q['reset'] for q in quotas.values()))
+        return token_id, self._clients[token_id]
+
+    def record(self, token_id, gh):
+        remaining, _ = gh.rate_limiting
+        self._conn.hset(self._key, token_id, json.dumps({
+            'remaining': remaining,
+            'reset': gh.rate_limiting_resettime,
+        }))
+
+    @contextmanager
+    def client(self, low=False):
+        """
+        Lends a client for a block of work, recording its remaining quota
+        """
+        token_id, gh = self.acquire(low)
+        try:
+            yield gh
+        finally:
+            try:
+                self.record(token_id, gh)
+            except (IOError, GithubException) as e:
+                logger.warning('Could not record the Github quota: {}'.format(e))
+
+def _urls(urls, env):
+    # A list or comma-separated string of URLs, defaulting to the env var's
+    if urls is None:
+        urls = os.environ.get(env, '')
+    if isinstance(urls, basestring):
+        urls = urls.split(',')
+    return [url for url in urls if url]
+
+class Replicas(object):
+    """
+    Round-robins reads across the replicas of a primary. A replica that
+    fails to connect is skipped for ``retry_after`` seconds, and reads fall
+    back to the primary when no replica is available.
+    """
+    def __init__(self, primary, replicas=(), retry_after=30):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.retry_after = retry_after
+        self._down = {}     # replicas' indexes to when they are retried
+        self._next = itertools.count()
+
+    def reader(self):
+        now = time.time()
+        for _ in range(len(self.replicas)):
+            i = next(self._next) % len(self.replicas)
+            if self._down.get(i, 0) <= now:
+                return self.replicas[i]
+        return self.primary
+
+    def read(self, func):
+        """
+        Calls ``func`` with a reader, retrying on the primary if the replica
+        fails
+        """
+        conn = self.reader()
+        try:
+            return func(conn)
+        except (ConnectionError, TimeoutError) as e:
+            if conn is self.primary:
+                raise
+            logger.warning('Replica failed, reading from the primary: {}'.format(e))
+            self._down[self.replicas.index(conn)] = time.time() + self.retry_after
+            return func(self.primary)
+
+class LRUCache(object):
+    """
+    A bounded in-process cache that evicts the least recently used entries,
+    and entries older than ``ttl`` seconds
+    """
+    def __init__(self, maxsize=256, ttl=60*60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.time():
+            return None
+        self._entries[key] = entry  # most recently used
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.time() + self.ttl)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class IndexWriter(object):
+    """
+    Writes module documents to the index readers use and, while a rebuild is
+    in flight, to the index being built too. The indexes are resolved anew
+    at every commit, after the documents were stored, so a writer never holds
+    on to a replaced index. Documents written during a rebuild are marked
+    for it to re-sync before switching over.
+    """
+    def __init__(self, conn, redis, batched=False):
+        self._conn = conn       # the document store, keeper of the pointers
+        self._redis = redis     # the search index connection
+        self._batched = batched
+        self._pending = []
+
+    def _resolve(self):
+        name, building = self._conn.mget(Hub._ixkey, Hub._ixbuildkey)
+        name = name or Hub._ixname
+        clients = [RediSearchClient(name, conn=self._redis)]
+        if building and building != name:
+            clients.append(RediSearchClient(building, conn=self._redis))
+        return clients, building
+
+    def add_document(self, doc_id, **fields):
+        self._pending.append((doc_id, fields))
+        if not self._batched:
+            self.commit()
+
+    def delete_document(self, doc_id):
+        self._pending.append((doc_id, None))
+        if not self._batched:
+            self.commit()
+
+    def commit(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        clients, building = self._resolve()
+        if building:
+            # Marked before writing, so a re-sync reads the stored documents
+            self._conn.sadd(Hub._ixdirtykey, *[doc_id for doc_id, _ in pending])
+        for i, client in enumerate(clients):
+            indexer = client.batch_indexer(chunk_size=len(pending))
+            for doc_id, fields in pending:
+                if fields is None:
+                    client.delete_document(doc_id, conn=indexer.pipeline)
+                elif i:
+                    # The index being built may already have the document
+                    indexer.add_document(doc_id, **dict(fields, replace=True))
+                else:
+                    indexer.add_document(doc_id, **fields)
+            indexer.commit()
+
 class Hub(object):
     dconn = None   # document store connection
     sconn = None   # search index connection
     qconn = None   # queue connection
-    gh = None
+    dreplicas = None    # document store reads
+    sreplicas = None    # search index reads
+    gh = None       # the default Github client
+    ghpool = None   # all of the Github clients
+    ghcache = None
     autocomplete = None
     repo = None
+    results = None  # cache of viewModules results
+    suggestions = None  # cache of viewSearchSuggestions results
+    _acsnapshot = None  # version and terms of the suggestions dictionary
     _ts = None
     _hubkey = 'hub:catalog'
+    _modskey = 'hub:modules'            # module ids by when they were added
+    _subskey = 'hub:submissions'        # recent submission ids by creation
+    _maxsubmissions = 1000
+    _queuename = 'default'  # of the jobs the hub enqueues
+    _bloblimit = 1000       # modules in a listing blob
+    _ixkey = 'hub:index'    # name of the index readers should use
+    _ixbuildkey = 'hub:index:building'  # name of the index being rebuilt
+    _ixdirtykey = 'hub:index:dirty'     # ids written during the rebuild
     _ixname = 'ix'
     _acname = 'ac'
 
-    def __init__(self, ghlogin_or_token=None, docs_url=None, search_url=None, queue_url=None, repo=None):
+    def __init__(self, ghlogin_or_token=None, docs_url=None, search_url=None, queue_url=None, repo=None, bootstrap=True,
+                 docs_replica_urls=None, search_replica_urls=None):
         timestamp = datetime.utcnow()
         logger.info('Initializing temporary hub {}'.format(timestamp))
+        self.results = LRUCache()
+        self.suggestions = LRUCache(maxsize=1024, ttl=5*60)
 
         if ghlogin_or_token:
-            self.gh = Github(ghlogin_or_token)
+            tokens = [ghlogin_or_token]
+        elif 'GITHUB_TOKENS' in os.environ:
+            tokens = [t for t in os.environ['GITHUB_TOKENS'].split(',') if t]
         elif 'GITHUB_TOKEN' in os.environ:
-            self.gh = Github(os.environ['GITHUB_TOKEN'])
+            tokens = [os.environ['GITHUB_TOKEN']]
         else:
+            tokens = []
             logger.info('Env var ''GITHUB_TOKEN'' not found')
 
         if docs_url:
@@ -65,7 +356,13 @@ class Hub(object):
         else:
             logger.critical('No Redis for document storage... bye bye.')
             raise RuntimeError('No Redis for document storage... bye bye.')
-        self.dconn = ReJSONClient().from_url(docs_url)
+        self.dconn = _connection(docs_url, ReJSONClient, 'docs')
+        self.dreplicas = Replicas(self.dconn, [_connection(url, ReJSONClient, 'docs_replica')
+            for url in _urls(docs_replica_urls, 'DOCS_REDIS_REPLICA_URLS')])
+        self.ghpool = GithubPool.of(self.dconn, tokens)
+        self.gh = self.ghpool.default
+        if self.gh:
+            self.ghcache = GithubCache(self.dconn, self.gh)
 
         if search_url:
             pass
@@ -73,7 +370,9 @@ class Hub(object):
             search_url = os.environ['SEARCH_REDIS_URL']
         else:
             search_url = docs_url
-        conn = Redis(connection_pool=ConnectionPool().from_url(search_url))
+        conn = _connection(search_url, Redis, 'search')
+        self.sreplicas = Replicas(conn, [_connection(url, Redis, 'search_replica')
+            for url in _urls(search_replica_urls, 'SEARCH_REDIS_REPLICA_URLS')])
         self.sconn = RediSearchClient(self._ixname, conn=conn)
         self.autocomplete = AutoCompleter(self._acname, conn=conn)
 
@@ -83,7 +382,7 @@ class Hub(object):
             queue_url = os.environ['QUEUE_REDIS_URL']
         else:
             queue_url = docs_url
-        self.qconn = StrictRedis.from_url(queue_url)
+        self.qconn = _connection(queue_url, service='queue')
 
         if repo:
             pass
@@ -94,16 +393,104 @@ class Hub(object):
             raise RuntimeError('No REDISMODULES_REPO... bye bye.')
         self.repo = repo
 
+        self.resolveIndex()
+
         # Check if hub exists
         if self.dconn.exists(self._hubkey):
             self._ts = datetime.fromtimestamp(float(self.dconn.jsonget(self._hubkey, Path('.created'))))
             logger.info('Latching to hub {}'.format(self._ts))
+            self.migrateCatalog()
+            self.backfillSorts()
+            self.ensureStatsRefresh()
+        elif not bootstrap:
+            self._ts = timestamp
+            logger.info('Hub not found, skipping its creation')
         else:
             self._ts = timestamp
             logger.info('Creating hub {}'.format(self._ts))
             self.createHub()
             self.addModulesRepo(self.repo)
 
+    def migrateCatalog(self):
+        """
+        Moves the module references and submissions that older hubs kept in
+        the catalog document to their own sorted sets
+        """
+        keys = self.dconn.jsonobjkeys(self._hubkey) or []
+        if 'modules' not in keys and 'submissions' not in keys:
+            return
+        # Only one process migrates, the others latch to the hub meanwhile
+        lock, token = '{}:migrating'.format(self._hubkey), uuid.uuid4().hex
+        if not self.dconn.set(lock, token, nx=True, ex=60):
+            logger.info('The catalog is being migrated by another process')
+            return
+        try:
+            logger.info('Migrating the catalog\'s modules and submissions')
+            modules, submissions = self._catalogPath('.modules'), self._catalogPath('.submissions')
+            pipe = self.dconn.pipeline(transaction=False)
+            if modules is not None:
+                for doc_id, ref in modules.items():
+                    pipe.zadd(self._modskey, **{doc_id: float(ref['created'])})
+                pipe.jsondel(self._hubkey, Path('.modules'))
+            if submissions is not None:
+                for sub in submissions:
+                    pipe.zadd(self._subskey, **{sub['id']: float(sub['created'])})
+                pipe.zremrangebyrank(self._subskey, 0, -self._maxsubmissions - 1)
+                pipe.jsondel(self._hubkey, Path('.submissions'))
+            pipe.execute()
+        finally:
+            self.dconn.eval(_unlock, 1, lock, token)
+
+    def _catalogPath(self, path):
+        # The value at the catalog's ``path``, or None if already migrated
+        try:
+            return self.dconn.jsonget(self._hubkey, Path(path))
+        except ResponseError:
+            return None
+
+    def backfillSorts(self, batch_size=100):
+        """
+        Adds the modules that hubs older than the listing orderings have to
+        them, along with the modules' blobs
+        """
+        pipe = self.dconn.pipeline(transaction=False)
+        pipe.zcard(self._modskey)
+        for sort in _sorts:
+            pipe.zcard(_sortkey(sort))
+        counts = pipe.execute()
+        if all(count == counts[0] for count in counts[1:]):
+            return
+        logger.info('Backfilling the listing orderings of {} modules'.format(counts[0]))
+        doc_ids = self.moduleIds()
+        for i in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[i:i + batch_size]
+            docs = self.dconn.jsonmget(Path.rootPath(), *[RedisModule.keyof(doc_id) for doc_id in batch])
+            pipe = self.dconn.pipeline(transaction=False)
+            for doc_id, doc in zip(batch, docs):
+                if doc is None:
+                    continue
+                stats = doc.get('stats')
+                _updateSorts(pipe, doc_id, stats, _scoreof(stats) if stats else None)
+                pipe.set(RedisModule.blobof(doc_id), json.dumps(doc))
+            pipe.execute()
+        self.dconn.incr(RedisModule._genkey)
+
+    def moduleIds(self):
+        return self.dconn.zrange(self._modskey, 0, -1)
+
+    def warmup(self):
+        """
+        Connects the hub's pools and resolves its index ahead of its first use
+        """
+        self.ping()
+        self.resolveIndex()
+
+    def ping(self):
+        """
+        Checks that all of the hub's connections are alive
+        """
+        return self.dconn.ping() and self.sconn.redis.ping() and self.qconn.ping()
+
     def get_repo_url(self):
         return 'https://github.com/{}'.format(self.repo)
 
@@ -113,14 +500,15 @@ class Hub(object):
         self.dconn.jsonset(self._hubkey, Path.rootPath(),
         {
             'created': str(_toepoch(self._ts)),
-            'modules': {},
-            'submissions': [],
             'submit_enabled': False
         })
 
         # Create a RediSearch index for the modules
         # TODO: catch errors
-        self.sconn.create_index((
+        self.createIndex(self.sconn)
+
+    def createIndex(self, client):
+        return client.create_index((
             TextField('name', sortable=True),
             TextField('description'),
             NumericField('stargazers_count', sortable=True),
@@ -128,36 +516,275 @@ class Hub(object):
             NumericField('last_modified', sortable=True)
         ), stopwords=stopwords)
 
+    def resolveIndex(self, name=None):
+        """
+        Switches the search client to the index the hub's pointer refers to,
+        ``name`` is the pointer's value if it had already been fetched
+        """
+        if name is None:
+            name = self.dconn.get(self._ixkey)
+        name = name or self._ixname
+        if name != self.sconn.index_name:
+            logger.info('Switching to index {}'.format(name))
+            self.sconn = RediSearchClient(name, conn=self.sconn.redis)
+
+    def indexWriter(self, batched=False):
+        """
+        Returns a writer of the index, which queues its writes until committed
+        if ``batched``
+        """
+        return IndexWriter(self.dconn, self.sconn.redis, batched)
+
+    def scheduleIndexRebuild(self):
+        """
+        Enqueues rebuilding the index, returns the job's id
+        """
+        return self.enqueue('index:rebuild', callRebuildIndex)
+
+    def rebuildIndex(self, batch_size=100, drop_delay=60):
+        """
+        Builds a new version of the index from the modules' documents, then
+        atomically points readers and writers at it and schedules dropping the
+        old one after ``drop_delay`` seconds. Writes made meanwhile go to both
+        indexes, and the documents they changed are re-synced before switching.
+        """
+        self.resolveIndex()
+        old = self.sconn.index_name
+        new = '{}:v{}'.format(self._ixname, self.dconn.incr('{}:version'.format(self._ixkey)))
+        logger.info('Rebuilding index {} as {}'.format(old, new))
+        client = RediSearchClient(new, conn=self.sconn.redis)
+        self.createIndex(client)
+
+        # Writers also write to the new index from here on
+        pipe = self.dconn.pipeline(transaction=True)
+        pipe.set(self._ixbuildkey, new)
+        pipe.delete(self._ixdirtykey)
+        pipe.execute()
+        try:
+            doc_ids = self.moduleIds()
+            for i in range(0, len(doc_ids), batch_size):
+                self._copyToIndex(client, doc_ids[i:i + batch_size])
+
+            # Catch up with the documents changed while copying
+            while True:
+                pipe = self.dconn.pipeline(transaction=True)
+                pipe.smembers(self._ixdirtykey)
+                pipe.delete(self._ixdirtykey)
+                changed = sorted(pipe.execute()[0])
+                if not changed:
+                    break
+                logger.info('Re-syncing {} modules changed during the rebuild'.format(len(changed)))
+                for i in range(0, len(changed), batch_size):
+                    self._copyToIndex(client, changed[i:i + batch_size])
+
+            # Switch readers and writers over, invalidating cached results
+            pipe = self.dconn.pipeline(transaction=True)
+            pipe.set(self._ixkey, new)
+            pipe.delete(self._ixbuildkey, self._ixdirtykey)
+            pipe.incr(RedisModule._genkey)
+            pipe.execute()
+        except Exception:
+            logger.error('Abandoning the rebuild of index {}'.format(new))
+            self.dconn.delete(self._ixbuildkey, self._ixdirtykey)
+            raise
+        self.resolveIndex(new)
+
+        # Writers resolve the index at every write, the delay lets the writes
+        # that resolved it before the switch complete
+        s = _scheduler(self.qconn)
+        s.schedule(datetime.utcnow() + timedelta(seconds=drop_delay), callDropIndex,
+                   args=(old,), id='index:drop:{}'.format(old))
+        return new
+
+    def _copyToIndex(self, client, doc_ids):
+        """
+        Writes the current documents of ``doc_ids`` to the index of ``client``,
+        backfilling the modules' blobs and listing orderings along
+        """
+        docs = self.dconn.jsonmget(Path.rootPath(), *[RedisModule.keyof(doc_id) for doc_id in doc_ids])
+        indexer = client.batch_indexer(chunk_size=len(doc_ids))
+        pipe = self.dconn.pipeline(transaction=False)
+        for doc_id, doc in zip(doc_ids, docs):
+            if doc is None:
+                client.delete_document(doc_id, conn=indexer.pipeline)
+                continue
+            stats = doc.get('stats')
+            score = _scoreof(stats) if stats else 1.0
+            indexer.add_document(doc_id, nosave=True, replace=True, score=score,
+                name=doc['name'], description=doc['description'], **(stats or {}))
+            _updateSorts(pipe, doc_id, stats, score)
+            pipe.set(RedisModule.blobof(doc_id), json.dumps(doc))
+        indexer.commit()
+        pipe.execute()
+
+    def dropIndex(self, name):
+        self.resolveIndex()
+        if name in (self.sconn.index_name, self.dconn.get(self._ixbuildkey)):
+            logger.error('Refusing to drop the index in use {}'.format(name))
+            return
+        logger.info('Dropping index {}'.format(name))
+        RediSearchClient(name, conn=self.sconn.redis).drop_index()
+
     def deleteHub(self):
         # TODO
         pass
 
     def addModule(self, mod):
-        logger.info('Adding module to hub {}'.format(mod['name']))
-        # Store the module object as a document
-        m = RedisModule(self.dconn, self.sconn, self.autocomplete, mod['name'])
-        m.save(mod)
-
-        # Add a reference to it in the master catalog
-        self.dconn.jsonset(self._hubkey, Path('.modules["{}"]'.format(m.get_id())), 
-        {
-            'id': m.get_id(),
-            'key': m.get_key(),
-            'created': str(_toepoch(self._ts)),
-        })
-
-        # Schedule a job to refresh repository statistics, starting from now and every hour
-        s = Scheduler(connection=self.qconn)
-        job = s.schedule(
+        return self.addModules([mod])[0]
+
+    def addModules(self, mods):
+        """
+        Adds the modules in ``mods`` to the hub, writing their documents,
+        index entries, catalog references and suggestions in bulk
+        """
+        pipe = self.dconn.pipeline(transaction=False)
+        indexer = self.indexWriter(batched=True)
+        suggestions = {}
+        added = []
+        now = _toepoch(datetime.utcnow())
+        for mod in mods:
+            logger.info('Adding module to hub {}'.format(mod['name']))
+            # Store the module object as a document
+            m = RedisModule(self.dconn, self.sconn, self.autocomplete, mod['name'])
+            m.save(mod, pipe=pipe, indexer=indexer, suggest=False)
+            suggestions[m.get_id()] = (RedisModule.suggestionsof(mod), None)
+
+            # Add a reference to it in the catalog, keeping when it was first added
+            pipe.execute_command('ZADD', self._modskey, 'NX', now, m.get_id())
+            added.append(m)
+
+        if added:
+            pipe.execute()
+            indexer.commit()
+            _updateSuggestions(self.autocomplete, suggestions)
+            self.dconn.incr(RedisModule._genkey)
+        return added
+
+    def removeModule(self, doc_id):
+        logger.info('Removing module from hub {}'.format(doc_id))
+        m = RedisModule(self.dconn, self.sconn, self.autocomplete, doc_id)
+        m.delete()
+        self.dconn.zrem(self._modskey, m.get_id())
+
+    def enqueue(self, job_id, func, *args):
+        """
+        Enqueues ``func`` as the job ``job_id``, unless that job is already
+        pending in which case the request is coalesced into it. Returns the
+        job's id.
+        """
+        pending = _jobkey('pending', job_id)
+        if not self.qconn.set(pending, 1, nx=True, ex=_jobttl):
+            logger.info('Coalesced {} into its pending job'.format(job_id))
+            return job_id
+        try:
+            _queue(self.qconn, self._queuename).enqueue_call(func, args=args, description=job_id)
+        except RedisError:
+            self.qconn.delete(pending)
+            raise
+        return job_id
+
+    def scheduleStatsRefresh(self):
+        """
+        Schedules the catalog's repository statistics refresh job, replacing
+        any previously scheduled ones (including legacy per-module jobs)
+        """
+        s = _scheduler(self.qconn)
+        funcs = ['{}.{}'.format(__name__, f.__name__)
+                 for f in (callRedisModuleUpateStats, callRefreshStats)]
+        for job in s.get_jobs():
+            if job.func_name in funcs:
+                s.cancel(job)
+
+        # Starting from now and every hour, its fixed id keeps it unique
+        return s.schedule(
             scheduled_time=datetime(1970,1,1),
-            func=callRedisModuleUpateStats,
-            args=[m.get_id()],
+            func=callRefreshStats,
             interval=60*60,     # every hour
             repeat=None,        # indefinitely
             ttl=0,
-            result_ttl=0
+            result_ttl=0,
+            id='stats:catalog'
         )
-        return m
+
+    def ensureStatsRefresh(self):
+        """
+        Schedules the stats refresh job unless it already is, replacing the
+        per-module jobs of hubs that predate it
+        """
+        s = _scheduler(self.qconn)
+        if self.qconn.zscore(s.scheduled_jobs_key, 'stats:catalog') is None:
+            logger.info('Scheduling the stats refresh')
+            self.scheduleStatsRefresh()
+
+    def refreshStats(self, batch_size=50, concurrency=8):
+        """
+        Refreshes the repository statistics of all the modules in the catalog,
+        ``batch_size`` modules at a time with up to ``concurrency`` concurrent
+        requests to Github
+        """
+        doc_ids = self.moduleIds()
+        pool = ThreadPool(concurrency)
+        batches = []
+        try:
+            for i in range(0, len(doc_ids), batch_size):
+                batch = doc_ids[i:i + batch_size]
+                try:
+                    with self.ghpool.client(low=True) as gh:
+                        count, duration = _durationms(self._refreshStatsBatch, pool, batch,
+                                                      GithubCache(self.dconn, gh))
+                except GithubQuotaError as e:
+                    # Leave the quota to submissions, and start over after it resets. The
+                    # repositories already refreshed are cheap, as conditional requests.
+                    logger.warning('Stopping the stats refresh after {}/{} modules, restarting it once '
+                                   'the quota resets: {}'.format(i, len(doc_ids), e))
+                    _scheduler(self.qconn).schedule(
+                        datetime.utcfromtimestamp(e.reset), callRefreshStats, id='stats:catalog:deferred')
+                    break
+                logger.info('Refreshed stats of {}/{} modules in {:.3f}ms'.format(count, len(batch), duration))
+                batches.append((count, duration))
+        finally:
+            pool.close()
+        return batches
+
+    def _refreshStatsBatch(self, pool, doc_ids, ghcache):
+        keys = [RedisModule.keyof(doc_id) for doc_id in doc_ids]
+        docs = self.dconn.jsonmget(Path.rootPath(), *keys)
+
+        def fetch(doc):
+            if doc is None:
+                return None
+            try:
+                res = _fetchRepositoryStats(ghcache, doc.get('repository'))
+            except GithubException as e:
+                logger.error('Could not fetch stats for {}: {}'.format(doc['name'], e))
+                return None
+            # Skip re-indexing modules whose stats haven't changed
+            if res is None or res[0] == doc.get('stats'):
+                return None
+            return res
+
+        # Write all the updates of the batch in one go
+        pipe = self.dconn.pipeline(transaction=False)
+        indexer = self.indexWriter(batched=True)
+        suggestions = {}
+        for doc_id, doc, res in zip(doc_ids, docs, pool.map(fetch, docs)):
+            if res is None:
+                continue
+            stats, score = res
+            pipe.jsonset(RedisModule.keyof(doc_id), Path('.stats'), stats)
+            doc['stats'] = stats
+            pipe.set(RedisModule.blobof(doc_id), json.dumps(doc))
+            _updateSorts(pipe, doc_id, stats, score)
+            indexer.add_document(doc_id,
+                nosave=True, replace=True,
+                score=score, name=doc['name'], description=doc['description'], **stats)
+            suggestions[doc_id] = (None, score)
+        if suggestions:
+            pipe.execute()
+            indexer.commit()
+            _updateSuggestions(self.autocomplete, suggestions)
+            self.dconn.incr(RedisModule._genkey)
+        return len(suggestions)
 
     """
     Adds modules to the hub from a local directory
@@ -176,19 +803,67 @@ class Hub(object):
     """
     Adds a modules to the hub from a github repository
     """
-    def addModulesRepo(self, name, path='/modules/'):
+    def addModulesRepo(self, name, path='/modules/', filenames=None):
         # TODO: check for success
-        q = Queue(connection=self.qconn)
-        q.enqueue(callLoadModulesFromRepo, name, path)
-
-    def loadModulesFromRepo(self, name, path):
+        self.enqueue(_loadJobId(name, path, filenames), callLoadModulesFromRepo, name, path, filenames)
+
+    def loadModulesFromRepo(self, name, path, filenames=None, concurrency=8, retries=3):
+        """
+        Loads the modules from the JSON files under ``path`` in the ``name``
+        repository, or only ``filenames`` if given, fetching up to
+        ``concurrency`` files at a time and retrying each up to ``retries``
+        times. Returns the names of the files that had failed.
+        """
         logger.info('Loading modules from Github {} {}'.format(name, path))
-        # TODO: error handling, sometimes not all contents are imported?
-        repo = self.gh.get_repo(name)
-        files = repo.get_dir_contents(path)
-        for f in files:
-            mod = json.loads(f.decoded_content)
-            m = self.addModule(mod)
+        from rq import get_current_job
+        job = get_current_job()
+
+        def fetch(f):
+            try:
+                return json.loads(_retried(lambda: f.decoded_content, retries=retries))
+            except (IOError, GithubException, ValueError) as e:
+                logger.warning('Fetching {} failed: {}'.format(f.name, e))
+                return None
+
+        pool = ThreadPool(concurrency)
+        mods = []
+        try:
+            # The client's quota is recorded once all of the files are fetched
+            with self.ghpool.client() as gh:
+                repo = gh.get_repo(name)
+                files = [f for f in _retried(repo.get_dir_contents, path) if f.name.endswith('.json')]
+                if filenames:
+                    files = [f for f in files if f.name in filenames]
+                progress = {'total': len(files), 'fetched': 0, 'failed': []}
+
+                for f, mod in zip(files, pool.imap(fetch, files)):
+                    if mod is None:
+                        progress['failed'].append(f.name)
+                    else:
+                        mods.append(mod)
+                    progress['fetched'] += 1
+                    logger.info('Fetched {}/{} module files'.format(progress['fetched'], progress['total']))
+                    if job:
+                        job.meta['progress'] = progress
+                        job.save_meta()
+        except GithubQuotaError as e:
+            # Pick up after the quota resets
+            logger.warning('Deferring loading modules from {} {}: {}'.format(name, path, e))
+            _scheduler(self.qconn).schedule(
+                datetime.utcfromtimestamp(e.reset), callLoadModulesFromRepo, args=(name, path, filenames),
+                id='{}:deferred'.format(_loadJobId(name, path, filenames)))
+            return None
+        finally:
+            pool.close()
+
+        if mods:
+            self.addModules(mods)
+        if progress['failed']:
+            logger.error('Could not load module files {}'.format(', '.join(progress['failed'])))
+
+        # Refresh the stats of the loaded modules, and then every hour
+        self.scheduleStatsRefresh()
+        return progress['failed']
 
     """
     Submits a module to the hub
@@ -214,66 +889,162 @@ class Hub(object):
             return res
 
         # Check if there's an active submission, or if the failure was too recent
-        submission = Submission(self.dconn, repo_id)
+        submission = Submission(self.dconn, repo_id).snapshot()
         if submission.exists:
             status = submission.status
             if status != 'failed':
                 res['status'] = 'active'
                 res['message'] = 'Active submission found for module'
                 return res
-            else:
+            elif not submission.resumable:
                 # TODO: handle failed submissions
                 res['message'] = 'Module already submitted to the hub and had failed, please reset manually for now'
                 return res
+            # Its processing was interrupted, resume it after its completed steps
+            logger.info('Resuming submission {}'.format(repo_id))
+        else:
+            # Store the new submission
+            submission.save(**kwargs)
 
-        # Store the new submission
-        submission.save(**kwargs)
-
-        # Record the submission in the catalog
-        # TODO: find a good use for that, e.g. 5 last submissions
-        self.dconn.jsonarrappend(self._hubkey, Path('.submissions'), {
-            'id': submission.get_id(),
-            'created': submission.created,
-        })
+            # Record the submission in the capped index of recent ones
+            pipe = self.dconn.pipeline(transaction=False)
+            pipe.zadd(self._subskey, **{submission.get_id(): submission.created})
+            pipe.zremrangebyrank(self._subskey, 0, -self._maxsubmissions - 1)
+            pipe.execute()
 
         # Add a job to process the submission
-        q = Queue(connection=self.qconn)
-        job = q.enqueue(callProcessSubmission, submission.get_id())
-        if job is None:
+        try:
+            job_id = self.enqueue('submission:{}'.format(submission.get_id()),
+                                  callProcessSubmission, submission.get_id())
+        except RedisError as e:
             res['message'] = 'Submission job could not be created'
             # TODO: design retry path
-            logger.error('Could not create submission processing job for {}'.format(submission.get_id()))
+            logger.error('Could not create submission processing job for {}: {}'.format(submission.get_id(), e))
         else:
             res['status'] = 'queued'
-            submission.status = res['status']
-            submission.job = job.id
+            with submission.batched():
+                submission.status = res['status']
+                submission.job = job_id
+                submission.resumable = False
 
         return res
 
-    def viewSubmissionStatus(self, repo_id):
-        submission = Submission(self.dconn, repo_id)
-        if submission.exists:
-            res = {
-                'id': submission.get_id(),
-                'status': submission.status,
-                'message': submission.message,
-            }
-            if 'finished' == res['status']:
-                res['pull_number'] = submission.pull_number
-                res['pull_url'] = submission.pull_url
+    def viewCatalog(self, offset=0, limit=100):
+        """
+        Lists the ids of the catalog's modules in the order they were added
+        """
+        return self.dreplicas.read(lambda conn: self._viewIndex(conn, self._modskey, 'modules', offset, limit, False))
+
+    def viewSubmissions(self, offset=0, limit=100):
+        """
+        Lists the most recent submissions and their statuses
+        """
+        def view(conn):
+            res = self._viewIndex(conn, self._subskey, 'submissions', offset, limit, True)
+            if res['submissions']:
+                keys = [Submission(conn, s['id']).get_key() for s in res['submissions']]
+                for sub, status in zip(res['submissions'], conn.jsonmget(Path('.status'), *keys)):
+                    sub['status'] = status
             return res
+        return self.dreplicas.read(view)
+
+    def _viewIndex(self, conn, key, name, offset, limit, reverse):
+        pipe = conn.pipeline(transaction=False)
+        pipe.zcard(key)
+        if reverse:
+            pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+        else:
+            pipe.zrange(key, offset, offset + limit - 1, withscores=True)
+        total, entries = pipe.execute()
+        return {
+            'results': total,
+            'offset': offset,
+            name: [{'id': entry, 'created': created} for entry, created in entries],
+        }
+
+    def viewSubmissionStatus(self, repo_id, primary=False):
+        """
+        Returns the submission's status from a replica, or from the primary
+        if ``primary`` is set to read the submitter's own writes
+        """
+        def view(conn):
+            submission = Submission(conn, repo_id).snapshot()
+            if submission.exists:
+                return submission.view()
+        return view(self.dconn) if primary else self.dreplicas.read(view)
+
+    def followSubmissionStatus(self, repo_id, timeout=15, duration=5*60):
+        """
+        Yields the submission's status and then each of its transitions until
+        it is done, or None every ``timeout`` seconds without one. Stops after
+        ``duration`` seconds so followers reconnect.
+        """
+        pubsub = self.dconn.pubsub(ignore_subscribe_messages=True)
+        # Subscribe before reading the status so no transition is missed
+        pubsub.subscribe(Submission.channelof(repo_id))
+        try:
+            status = self.viewSubmissionStatus(repo_id, primary=True)
+            deadline = time.time() + duration
+            while status is not None:
+                yield status
+                if status['status'] in ('failed', 'finished'):
+                    return
+                status = None
+                while status is None and time.time() < deadline:
+                    message = pubsub.get_message(timeout=timeout)
+                    if message is None:
+                        yield None
+                    else:
+                        status = json.loads(message['data'])
+        finally:
+            pubsub.close()
 
     def processSubmission(self, repo_id):
         logger.info('Processing submision for {}'.format(repo_id))
         submission = Submission(self.dconn, repo_id)
-        if submission.exists:
-            return submission.process(self.gh, self.repo)
+        if not submission.exists:
+            return None
+        try:
+            with self.ghpool.client() as gh:
+                try:
+                    return submission.process(gh, self.repo)
+                except RateLimitExceededException:
+                    raise GithubQuotaError(gh.rate_limiting_resettime)
+        except GithubQuotaError as e:
+            # Resume the submission once the quota resets
+            logger.warning('Deferring submission {}: {}'.format(repo_id, e))
+            _scheduler(self.qconn).schedule(
+                datetime.utcfromtimestamp(e.reset), callProcessSubmission, args=(repo_id,),
+                id='submission:{}:deferred'.format(repo_id))
+            submission.set_status('queued', 'Waiting for Github quota, processing resumes at {} UTC'.format(
+                datetime.utcfromtimestamp(e.reset).strftime('%H:%M')))
+            return None
+
+    def viewModules(self, query=None, sort=None, offset=0, limit=1000, fields=None):
+        return self.dreplicas.read(lambda conn: self._viewModulesFrom(conn, query, sort, offset, limit, fields))
+
+    def _viewModulesFrom(self, conn, query, sort, offset, limit, fields):
+        # Results are cached until the catalog's generation changes
+        generation, ixname = conn.mget(RedisModule._genkey, self._ixkey)
+        self.resolveIndex(ixname)
+        key = (generation, ' '.join((query or '').lower().split()), sort,
+               offset, limit, tuple(fields or ()))
+        res = self.results.get(key)
+        if res is not None:
+            return dict(res, cached=True)
+
+        res = self._viewModules(conn, query, sort, offset, limit, fields)
+        self.results.set(key, res)
+        return res
 
-    def viewModules(self, query=None, sort=None):
+    def _viewModules(self, conn, query, sort, offset, limit, fields):
         if not query:
+            res = self._listModules(conn, sort, offset, limit, fields)
+            if res is not None:
+                return res
             # Use a purely negative query to get all modules
             query = '-etaoinshrdlu'
-        q = Query(query).no_content().paging(0, 1000)
+        q = Query(query).no_content().paging(offset, limit)
         if sort:
             if sort == 'relevance':
                 pass
@@ -286,27 +1057,155 @@ class Hub(object):
             elif sort == 'name':
                 q.sort_by('name')
 
-        results = self.sconn.search(q)
-        mods = []
-        fetch_duration = 0
-        # TODO: this should be pipelined
-        for doc in results.docs:
-            m = RedisModule(self.dconn, self.sconn, self.autocomplete, doc.id)
-            res, duration = _durationms(m.to_dict)
-            mods.append(res)
-            fetch_duration += duration
+        index = self.sconn.index_name
+        results = self.sreplicas.read(lambda sconn: RediSearchClient(index, conn=sconn).search(q))
+        mods, fetch_duration = _durationms(self.getModules, [doc.id for doc in results.docs], fields, conn)
 
         return {
             'results': results.total,
+            'offset': offset,
             'search_duration': '{:.3f}'.format(results.duration),
             'fetch_duration': '{:.3f}'.format(fetch_duration),
             'total_duration': '{:.3f}'.format(fetch_duration + results.duration),
             'modules': mods,
         }
 
-    def viewSearchSuggestions(self, prefix):
-        suggestions = self.autocomplete.get_suggestions(prefix)
-        return [s.string for s in suggestions]
+    def _listModules(self, conn, sort, offset, limit, fields):
+        """
+        Lists the modules in one of the precomputed orderings, or returns None
+        if they don't hold all of the catalog's modules yet
+        """
+        if sort not in _sorts:
+            sort = 'relevance'
+        key = _sortkey(sort)
+        desc = _sorts[sort][0]
+        pipe = conn.pipeline(transaction=False)
+        pipe.zcard(self._modskey)
+        pipe.zcard(key)
+        if desc:
+            pipe.zrevrange(key, offset, offset + limit - 1)
+        else:
+            pipe.zrange(key, offset, offset + limit - 1)
+        (catalog, total, doc_ids), list_duration = _durationms(pipe.execute)
+        if not total or total != catalog:
+            return None
+        mods, fetch_duration = _durationms(self.getModules, doc_ids, fields, conn)
+
+        return {
+            'results': total,
+            'offset': offset,
+            'search_duration': '{:.3f}'.format(list_duration),
+            'fetch_duration': '{:.3f}'.format(fetch_duration),
+            'total_duration': '{:.3f}'.format(fetch_duration + list_duration),
+            'modules': mods,
+        }
+
+    def viewModulesBlob(self, sort=None):
+        """
+        Returns the first page of the listing in the ``sort`` order, i.e. its
+        first ``_bloblimit`` modules, as gzipped JSON. It is assembled from the
+        modules' blobs once per generation of the catalog and shared by all
+        processes, replacing the previous generation's.
+        """
+        if sort not in _sorts:
+            sort = 'relevance'
+        generation = self.dreplicas.read(lambda conn: conn.get(RedisModule._genkey)) or '0'
+        key = ('blob', generation, sort)
+        blob = self.results.get(key)
+        if blob is None:
+            # A single blob per sort, stored after the generation it is of
+            blobkey = 'blob:listing:{}'.format(sort)
+            stored = self.dreplicas.read(lambda conn: conn.get(blobkey))
+            if stored is not None and stored.split('\n', 1)[0] == generation:
+                blob = stored.split('\n', 1)[1]
+            else:
+                blob = self._assembleModulesBlob(sort, self._bloblimit)
+                self.dconn.set(blobkey, '{}\n'.format(generation) + blob)
+            self.results.set(key, blob)
+        return blob
+
+    def _assembleModulesBlob(self, sort, limit):
+        start = time.time()
+        pipe = self.dconn.pipeline(transaction=False)
+        pipe.zcard(self._modskey)
+        pipe.zcard(_sortkey(sort))
+        if _sorts[sort][0]:
+            pipe.zrevrange(_sortkey(sort), 0, limit - 1)
+        else:
+            pipe.zrange(_sortkey(sort), 0, limit - 1)
+        catalog, total, doc_ids = pipe.execute()
+        if not total or total != catalog:
+            # The orderings haven't been fully built yet
+            body = json.dumps(self.viewModules(sort=sort, limit=limit))
+        else:
+            list_duration = (time.time() - start) * 1000.0
+            blobs = self.dconn.mget([RedisModule.blobof(doc_id) for doc_id in doc_ids])
+            # Serialize the documents of modules saved before they had blobs
+            missing = [i for i, blob in enumerate(blobs) if blob is None]
+            if missing:
+                docs = self.dconn.jsonmget(Path.rootPath(), *[RedisModule.keyof(doc_ids[i]) for i in missing])
+                pipe = self.dconn.pipeline(transaction=False)
+                for i, doc in zip(missing, docs):
+                    if doc is not None:
+                        blobs[i] = json.dumps(doc)
+                        pipe.set(RedisModule.blobof(doc_ids[i]), blobs[i])
+                pipe.execute()
+            fetch_duration = (time.time() - start) * 1000.0 - list_duration
+            body = '{{"results": {}, "offset": 0, "search_duration": "{:.3f}", "fetch_duration": "{:.3f}", ' \
+                   '"total_duration": "{:.3f}", "modules": [{}]}}'.format(
+                       total, list_duration, fetch_duration, list_duration + fetch_duration,
+                       ','.join(blob for blob in blobs if blob is not None))
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return gzip.compress(body) + gzip.flush()
+
+    def getModules(self, doc_ids, fields=None, conn=None):
+        """
+        Fetches the documents of the modules in ``doc_ids`` with a single
+        `JSON.MGET`, preserving their order and skipping missing ones. Reads
+        from ``conn`` if given, the primary otherwise.
+
+        If ``fields`` is given, only these top-level fields are fetched with a
+        pipelined `JSON.MGET` per field, and documents that have none of them
+        are skipped.
+        """
+        if not doc_ids:
+            return []
+        conn = conn or self.dconn
+        keys = [RedisModule.keyof(doc_id) for doc_id in doc_ids]
+        if not fields:
+            docs = conn.jsonmget(Path.rootPath(), *keys)
+            return [doc for doc in docs if doc is not None]
+
+        pipe = conn.pipeline(transaction=False)
+        for field in fields:
+            pipe.jsonmget(Path(field), *keys)
+        docs = [{} for _ in keys]
+        for field, values in zip(fields, pipe.execute()):
+            for doc, value in zip(docs, values):
+                if value is not None:
+                    doc[field] = value
+        return [doc for doc in docs if doc]
+
+    def viewSearchSuggestions(self, prefix, num=10, fuzzy=False):
+        key = (prefix.lower(), num, fuzzy)
+        res = self.suggestions.get(key)
+        if res is None:
+            suggestions = self.sreplicas.read(lambda conn: AutoCompleter(self._acname, conn=conn).get_suggestions(
+                prefix, fuzzy=fuzzy, num=num))
+            res = [s.string for s in suggestions]
+            self.suggestions.set(key, res)
+        return res
+
+    def viewSuggestionsSnapshot(self):
+        """
+        Returns the version of the suggestions dictionary and all its terms,
+        sorted for prefix lookups by clients
+        """
+        version = self.sreplicas.read(lambda conn: conn.get(_suggestionsversionkey(self.autocomplete))) or '0'
+        if self._acsnapshot is None or self._acsnapshot[0] != version:
+            terms = self.sreplicas.read(lambda conn: conn.zrange(_termskey(self.autocomplete), 0, -1))
+            self._acsnapshot = (version, terms)
+        return self._acsnapshot
 
 class Repository(object):
     data = None
@@ -353,30 +1252,84 @@ class GithubAuthor(Author):
 class ReJSONObject(object):
     _key = None
     _conn = None
+    _snapshot = None    # attributes loaded by snapshot()
+    _names = None       # of the attributes in a partial snapshot
+    _pipe = None        # pending writes in batched()
 
     def __init__(self, conn, key):
         object.__setattr__(self, '_conn', conn)
         object.__setattr__(self, '_key', key)
 
     def __getattr__(self, name):
+        if self._snapshot is not None:
+            if self._names is not None and name not in self._names:
+                raise AttributeError('{} is not in the snapshot of {}'.format(name, self._key))
+            return self._snapshot.get(name)
         path = Path(name)
         if self._conn.jsontype(self._key, path):
             return self._conn.jsonget(self._key, path)
 
     def __setattr__(self, name, value):
-        return self._conn.jsonset(self._key, Path(name), value)
+        if self._snapshot is not None:
+            self._snapshot[name] = value
+            if self._names is not None:
+                self._names.add(name)
+        return (self._pipe or self._conn).jsonset(self._key, Path(name), value)
 
     def __delattr__(self, name):
-        return self._conn.jsondel(self._key, Path(name))
+        if self._snapshot is not None:
+            self._snapshot.pop(name, None)
+        return (self._pipe or self._conn).jsondel(self._key, Path(name))
+
+    def snapshot(self, *names):
+        """
+        Loads the object, or only its ``names`` attributes, in a single round
+        trip and serves later reads from memory until invalidate() is called.
+        Reading an attribute that a partial snapshot didn't load raises an
+        AttributeError.
+        """
+        if names:
+            # A `JSON.MGET` per attribute, as missing ones are nil rather than errors
+            pipe = self._conn.pipeline(transaction=False)
+            for name in names:
+                pipe.jsonmget(Path(name), self._key)
+            values = dict((name, res[0]) for name, res in zip(names, pipe.execute()) if res[0] is not None)
+            object.__setattr__(self, '_names', set(names))
+        else:
+            values = self._conn.jsonmget(Path.rootPath(), self._key)[0] or {}
+            object.__setattr__(self, '_names', None)
+        object.__setattr__(self, '_snapshot', values)
+        return self
+
+    def invalidate(self):
+        object.__setattr__(self, '_snapshot', None)
+        object.__setattr__(self, '_names', None)
+
+    @contextmanager
+    def batched(self):
+        """
+        Coalesces the writes made in the block into a single pipelined flush
+        """
+        object.__setattr__(self, '_pipe', self._conn.pipeline(transaction=False))
+        try:
+            yield self
+        finally:
+            pipe = self._pipe
+            object.__setattr__(self, '_pipe', None)
+            pipe.execute()
 
     @property
     def exists(self):
+        if self._snapshot is not None and self._names is None:
+            return bool(self._snapshot)
         return self._conn.exists(self._key)
 
     def get_key(self):
         return self._key
 
     def to_dict(self):
+        if self._snapshot is not None:
+            return dict(self._snapshot) if self._snapshot else None
         if self.exists:
             return self._conn.jsonget(self._key)
 
@@ -406,29 +1359,122 @@ class Submission(ReJSONObject):
             submission['details']['icon_url'] = kwargs['icon_url']
         if 'certification' in kwargs:
             submission['certification'] = kwargs['certification']
+        submission['steps'] = {}
+        submission['resumable'] = False
 
-        return self._conn.jsonset(self._key, Path.rootPath(), submission)
+        # Keep what was written as the snapshot
+        self.invalidate()
+        res = self._conn.jsonset(self._key, Path.rootPath(), submission)
+        object.__setattr__(self, '_snapshot', submission)
+        return res
 
     def get_id(self):
         return self._repo_id
 
+    @staticmethod
+    def channelof(repo_id):
+        return 'submission:{}:events'.format(repo_id.lower())
+
+    def view(self):
+        """
+        Returns the submission's status as shown to the submitter
+        """
+        res = {
+            'id': self.get_id(),
+            'status': self.status,
+            'message': self.message,
+        }
+        if 'finished' == res['status']:
+            res['pull_number'] = self.pull_number
+            res['pull_url'] = self.pull_url
+        return res
+
+    def __setattr__(self, name, value):
+        ReJSONObject.__setattr__(self, name, value)
+        # Followers see every progress message
+        if name == 'message':
+            self._publish()
+
+    def _publish(self):
+        # Pushes the status to its followers, along with the batched writes
+        (self._pipe or self._conn).publish(Submission.channelof(self._repo_id), json.dumps(self.view()))
+
     def set_status(self, status, message):
-        self.status = status
-        self.message = message
+        if self._snapshot is None:
+            self.snapshot()
+        with self.batched():
+            self.status = status
+            self.message = message
 
     def process(self, gh, hubrepo):
+        """
+        Processes the submission as a sequence of steps, persisting each
+        step's result so a retried job resumes after the last completed one
+        """
         logger.info('Submission {} processing started'.format(self._repo_id))
-        # TODO: should this be broken to littler steps?
+        self.snapshot()
+        if self.steps is None:
+            self.steps = {}
+        elif self.steps:
+            logger.info('Submission {} resuming after {}'.format(self._repo_id, ', '.join(self.steps)))
+            self.set_status('started', 'Resuming submission')
+
+        pool = ThreadPool(4)
+        try:
+            validated = self._step('validate', self._validate, gh, pool)
+            if validated is None:
+                return
+            mod = validated['module']
+            branch = self._step('branch', self._prepareBranch, gh, hubrepo, mod, pool)
+            commit = self._step('commit', self._commit, gh, hubrepo, mod, branch, pool)
+            self._step('ref', self._updateRef, gh, hubrepo, branch, commit)
+            pull = self._step('pull', self._pull, gh, hubrepo, mod, validated['owner'], branch)
+            if pull['created']:
+                self._step('labels', self._label, gh, hubrepo, pull)
+        except Exception:
+            # Submitting the module again resumes it, see Hub.submitModule
+            with self.batched():
+                self.status = 'failed'
+                self.resumable = True
+                self.message = 'Processing was interrupted, submit the module again to resume it'
+            raise
+        finally:
+            pool.close()
+
+        with self.batched():
+            self.status = 'finished'
+            self.pull_number = pull['number']
+            self.pull_url = pull['url']
+            self._publish()
+        return pull['number']
+
+    def _step(self, name, func, *args):
+        steps = self.steps
+        if name in steps:
+            return steps[name]
+        res = func(*args)
+        if res is not None:
+            steps[name] = res
+            self._conn.jsonset(self._key, Path('.steps.{}'.format(name)), res)
+        return res
+
+    def _validate(self, gh, pool):
+        # TODO: try to validate submission a litle more, e.g. README and LICENSE exist, other min reqs?
+        # TODO: currenty only gh authors
         details = self.details
+        authors = details.get('authors') or []
+        self.set_status('started', 'Fetching repository and validating authors')
+        calls = [(gh.get_repo, self._repo_id, False)] + [(gh.get_user, author) for author in authors]
+        found = pool.map(lambda call: _found(*call), calls)
 
-        try:
-            # TODO: try to validate submission a litle more, e.g. README and LICENSE exist, other min reqs?
-            self.set_status('started', 'Fetching repository')
-            subrepo = gh.get_repo(self._repo_id)
-            description = subrepo.description or 'This module has an air of mystery about it' 
-        except UnknownObjectException:
+        subrepo = found[0]
+        if subrepo is None:
             self.set_status('failed', 'Repository not found on Github')
-            return
+            return None
+        for author, user in zip(authors, found[1:]):
+            if user is None:
+                self.set_status('failed', 'Author {} not found on Github'.format(author))
+                return None
 
         # TODO: move this to using RedisModule class as template
         mod = {
@@ -440,218 +1486,585 @@ class Submission(ReJSONObject):
                 'url': 'https://github.com/{}'.format(details['repository'])
             },
             'documentation': self.docs_url,
-            'description': description,
-            'authors': []
+            'description': subrepo.description or 'This module has an air of mystery about it',
+            'authors': [{
+                'type': 'github',
+                'id': author,
+                'url': 'https://github.com/{}'.format(author)
+            } for author in authors]
         }
 
-        # Validate authors
-        # TODO: currenty only gh
-        self.message = 'Validating authors'
-        if authors in details:
-            for author in details['authors']:
-                try:
-                    ghauthor = gh.get_user(author)
-                except UnknownObjectException:
-                    self.set_status('failed', 'Author {} not found on Github'.format(author))
-                    return
-                mod['authors'].append({
-                    'type': 'github',
-                    'id': author,
-                    'url': 'https://github.com/{}'.format(author)
-                })
-
         # TODO: validate and try to bring the icon from url and/or file upload
         if 'icon_url' in details and details['icon_url']:
             mod['icon'] = details['icon_url']
 
-        # Submit to Github as a pull request
-        ghrepo = gh.get_repo(hubrepo)
-        ghdefault = ghrepo.get_branch(ghrepo.default_branch)
-
-        # Get the branch for the submission
-        try:
-            ghsubref = ghrepo.get_git_ref('heads/submissions/{}'.format(mod['name']))
-            self.message = 'Found existing submission reference'
-        except UnknownObjectException:
-            ghsubref = None
+        return {
+            'module': mod,
+            'owner': subrepo.owner.login,
+        }
 
-        # Create it if it doesn't exist
+    def _prepareBranch(self, gh, hubrepo, mod, pool):
+        # Submit to Github as a pull request from the submission's branch
+        self.message = 'Preparing a branch for submission'
+        ghrepo = gh.get_repo(hubrepo, lazy=False)
+        head = 'submissions/{}'.format(mod['name'])
+        ghdefault, ghsubref, pulls = pool.map(lambda call: _found(*call), [
+            (ghrepo.get_branch, ghrepo.default_branch),
+            (ghrepo.get_git_ref, 'heads/{}'.format(head)),
+            (lambda: list(ghrepo.get_pulls(head=head)),),
+        ])
+
+        # Create the branch if it doesn't exist
         if not ghsubref or not ghsubref.ref:
             self.message = 'Creating a branch for submission'
-            ghsubref = ghrepo.create_git_ref('refs/heads/submissions/{}'.format(mod['name']), ghdefault.commit.sha)
+            ghrepo.create_git_ref('refs/heads/{}'.format(head), ghdefault.commit.sha)
+
+        # TODO: is it safe to assume 0 or 1 pull requests?
+        return {
+            'base': ghdefault.name,
+            'head': head,
+            'pull': pulls[-1].number if pulls else None,
+        }
 
-        self.message = 'Creating commit tree'
-        ghsub = ghrepo.get_branch('submissions/{}'.format(mod['name']))
-        parent = ghrepo.get_git_commit(ghsub.commit.sha)
+    def _commit(self, gh, hubrepo, mod, branch, pool):
+        self.message = 'Creating commit'
+        ghrepo = gh.get_repo(hubrepo)
+        ghsub = ghrepo.get_branch(branch['head'])
+        parent, currtree = pool.map(lambda call: call[0](call[1]), [
+            (ghrepo.get_git_commit, ghsub.commit.sha),
+            (ghrepo.get_git_tree, ghsub.commit.sha),
+        ])
 
         # Create a new tree from the existing reference
         # TODO: add the icon if fetchable & suitable
-        currtree = ghrepo.get_git_tree(ghsub.commit.sha)
         jsonfile = json.dumps(mod, indent=4, separators=(',', ': '))
         elems = [
             InputGitTreeElement('modules/{}.json'.format(mod['name']), '100644', 'blob', content=jsonfile),
         ]
         tree = ghrepo.create_git_tree(elems, base_tree=currtree)
 
-        # Fetch the existing pull request, if it does
-        self.message = 'Checking existing pull requests'
-        pr = None
-        for p in ghrepo.get_pulls(head=ghsub.name):
-            # TODO: is it safe to assume 0 or 1?
-            pr = p
-
-        # Commit the tree
-        self.message = 'Creating commit'
-        if pr:
+        if branch['pull']:
             message = 'Updates submission'
         else:
             message = 'Initial submission of module {}'.format(mod['name'])
         commit = ghrepo.create_git_commit(message, tree, [parent])
-        self.commit = commit.sha
+        return commit.sha
 
-        # Update the submission's reference
+    def _updateRef(self, gh, hubrepo, branch, commit):
         # TODO: resolve why this isn't a fast forward
         self.message = 'Updating branch reference'
-        ghsubref.edit(commit.sha, force=True)
-
-        # Create a PR if it doesn't exist already
-        if not pr:
-            self.message = 'Creating pull request'
-            # Prepare the body of the pull request
-            labels = [ 'submission' ]
-            certification = self.certification
-            body =  'This module has been submitted via the hub.\n\n'
-            body += 'Owner: @{}\n'.format(subrepo.owner.login)
-            if mod['authors']:
-                body += 'Authors:'
-                for author in mod['authors']:
-                    body += ' @{}'.format(author['id'])
-            if certification:
-                body += '\n\nThe submitter had asked for the module to be certified.'
-                labels.append('certification')
-
-            # The pull request is created against the master branch
-            prkw = {
-                'title': '[SUBMISSION] {}'.format(mod['name']),
-                'body': body,
-                'head': ghsub.name,
-                'base': ghdefault.name,
-            }
-            pr = ghrepo.create_pull(**prkw)
-
-            # Set up labels for the pull's issue
-            self.message = 'Setting labels'
-            issue = ghrepo.get_issue(pr.number)
-            issue.edit(labels=labels)
+        ghrepo = gh.get_repo(hubrepo)
+        ghrepo.get_git_ref('heads/{}'.format(branch['head'])).edit(commit, force=True)
+        return commit
 
-        self.status = 'finished'
-        self.pull_number = pr.number
-        self.pull_url = pr.html_url
-        return pr.number
+    def _pull(self, gh, hubrepo, mod, owner, branch):
+        ghrepo = gh.get_repo(hubrepo)
+        if branch['pull']:
+            pr = ghrepo.get_pull(branch['pull'])
+            return {'number': pr.number, 'url': pr.html_url, 'created': False}
+
+        # Prepare the body of the pull request
+        self.message = 'Creating pull request'
+        body =  'This module has been submitted via the hub.\n\n'
+        body += 'Owner: @{}\n'.format(owner)
+        if mod['authors']:
+            body += 'Authors:'
+            for author in mod['authors']:
+                body += ' @{}'.format(author['id'])
+        if self.certification:
+            body += '\n\nThe submitter had asked for the module to be certified.'
+
+        # The pull request is created against the master branch
+        prkw = {
+            'title': '[SUBMISSION] {}'.format(mod['name']),
+            'body': body,
+            'head': branch['head'],
+            'base': branch['base'],
+        }
+        pr = ghrepo.create_pull(**prkw)
+        return {'number': pr.number, 'url': pr.html_url, 'created': True}
+
+    def _label(self, gh, hubrepo, pull):
+        # Set up labels for the pull's issue
+        self.message = 'Setting labels'
+        labels = [ 'submission' ]
+        if self.certification:
+            labels.append('certification')
+        issue = gh.get_repo(hubrepo).get_issue(pull['number'])
+        issue.edit(labels=labels)
+        return labels
+
+def _found(func, *args):
+    """
+    Calls ``func``, returning None if what it gets isn't found on Github
+    """
+    try:
+        return _retried(func, *args)
+    except UnknownObjectException:
+        return None
 
 class RedisModule(ReJSONObject):
     _doc_id = None
     _autocomplete = None
     _sconn = None
+    _genkey = 'hub:generation'  # bumped whenever a module changes
 
     def __init__(self, dconn, sconn, autocomplete, doc_id):
         object.__setattr__(self, '_doc_id', doc_id.lower())
         object.__setattr__(self, '_autocomplete', autocomplete)
         object.__setattr__(self, '_sconn', sconn)
-        ReJSONObject.__init__(self, dconn, 'module:{}'.format(self._doc_id))
+        ReJSONObject.__init__(self, dconn, RedisModule.keyof(self._doc_id))
+
+    @staticmethod
+    def keyof(doc_id):
+        return 'module:{}'.format(doc_id.lower())
 
     def get_id(self):
         return self._doc_id
 
-    def save(self, mod):
-        # Store the module
-        self._conn.jsonset(self._key, Path.rootPath(), mod)
+    def _indexWriter(self):
+        return IndexWriter(self._conn, self._sconn.redis)
+
+    @staticmethod
+    def blobof(doc_id):
+        # The module's document, serialized for stitching into listings
+        return 'blob:module:{}'.format(doc_id.lower())
+
+    @staticmethod
+    def suggestionsof(mod):
+        """
+        Returns the words of the module's name and description to suggest
+        """
+        text = '{} {}'.format(mod['name'], mod['description'])
+        words = set(re.compile('\w+').findall(text))
+        words = set(w.lower() for w in words)
+        return words.difference(stopwords)
+
+    def save(self, mod, pipe=None, indexer=None, suggest=True):
+        """
+        Saves the module, optionally queuing the writes in ``pipe`` and the
+        batch ``indexer`` instead of executing them right away
+        """
+        # Store the module, its stats are reset until the next refresh
+        (pipe or self._conn).jsonset(self._key, Path.rootPath(), mod)
+        (pipe or self._conn).set(RedisModule.blobof(self._doc_id), json.dumps(mod))
+        _updateSorts(pipe or self._conn, self._doc_id, mod.get('stats'))
 
         # Index it
-        self._sconn.add_document(self._doc_id, nosave=True,
+        (indexer or self._indexWriter()).add_document(self._doc_id, nosave=True, replace=True,
             name=mod['name'],
             description=mod['description'], 
         )
 
         # Add the module's name and description to the suggestions engine
-        text = '{} {}'.format(mod['name'], mod['description'])
-        words = set(re.compile('\w+').findall(text))
-        words = set(w.lower() for w in words)
-        words = words.difference(stopwords)
-        self._autocomplete.add_suggestions(*[Suggestion(w) for w in words])
-
-    def updateStats(self, gh):
+        if suggest:
+            _updateSuggestions(self._autocomplete, {
+                self._doc_id: (RedisModule.suggestionsof(mod), None),
+            })
+
+        # Pipelined saves are accounted for by the caller once executed
+        if pipe is None:
+            self._conn.incr(self._genkey)
+
+    def delete(self):
+        """
+        Deletes the module's document, index entry and suggestions
+        """
+        pipe = self._conn.pipeline(transaction=False)
+        pipe.delete(self._key, RedisModule.blobof(self._doc_id))
+        for sort in _sorts:
+            pipe.zrem(_sortkey(sort), self._doc_id.lower())
+        pipe.execute()
+        # Unindexed once gone, so a rebuild can't copy it back in meanwhile
+        self._indexWriter().delete_document(self._doc_id)
+        _updateSuggestions(self._autocomplete, {self._doc_id: (set(), None)})
+        self._conn.incr(self._genkey)
+
+    def updateStats(self, ghcache):
         # github.enable_console_debug_logging()
+        self.snapshot()
         repository = self.repository
+        res = _fetchRepositoryStats(ghcache, repository)
+        if res is None:
+            return
+        stats, score = res
+        if stats == self.stats:
+            return
 
-        if repository and \
-            'type' in repository and repository['type'] == 'github' and \
-            'id' in repository:
-
-            logger.info('Fetching stats for {}'.format(repository['id']))
-            repo = gh.get_repo(repository['id'])
-            # Basic repository stats
-            stats = {
-                'stargazers_count': repo.stargazers_count,
-                'forks_count': repo.forks_count,
-                'last_modified': (datetime.today() - repo.pushed_at).days
-            }
+        with self.batched():
+            self.stats = stats
+            self._pipe.set(RedisModule.blobof(self._doc_id), json.dumps(self.to_dict()))
+            _updateSorts(self._pipe, self._doc_id, stats, score)
+        self._indexWriter().add_document(self._doc_id,
+            nosave=True, replace=True,
+            score=score, name=self.name, description=self.description, **stats)
+        _updateSuggestions(self._autocomplete, {self._doc_id: (None, score)})
+        self._conn.incr(self._genkey)
 
-            # The relevance score of a module
-            score = 0.0
-            # It has to be fresh
-            if stats['last_modified'] < 100:
-                score += 0.70 * ((100 - stats['last_modified'])/100.0)
-            # with peeps adoring it
-            if stats['stargazers_count'] < 637:
-                score += 0.20 * (stats['stargazers_count']/637.0)
-            else:
-                score += 0.20
-            # and some developer interest
-            if stats['forks_count'] < 10:
-                score += 0.10 * (stats['forks_count']/10.0)
+def _fetchRepositoryStats(ghcache, repository):
+    """
+    Fetches the stats of a module's repository, returns them along with the
+    module's relevance score or None if the repository isn't on Github
+    """
+    if not repository or \
+        'type' not in repository or repository['type'] != 'github' or \
+        'id' not in repository:
+        return None
+
+    logger.info('Fetching stats for {}'.format(repository['id']))
+    repo, release = ghcache.get_repo(repository['id'])
+    # Basic repository stats
+    stats = {
+        'stargazers_count': repo.stargazers_count,
+        'forks_count': repo.forks_count,
+        'last_modified': (datetime.today() - repo.pushed_at).days
+    }
+
+    # Last release, if exists
+    if release:
+        stats['last_release'] = release
+
+    return stats, _scoreof(stats)
+
+def _scoreof(stats):
+    """
+    Returns the relevance score of a module from its repository stats
+    """
+    score = 0.0
+    # It has to be fresh
+    if stats['last_modified'] < 100:
+        score += 0.70 * ((100 - stats['last_modified'])/100.0)
+    # with peeps adoring it
+    if stats['stargazers_count'] < 637:
+        score += 0.20 * (stats['stargazers_count']/637.0)
+    else:
+        score += 0.20
+    # and some developer interest
+    if stats['forks_count'] < 10:
+        score += 0.10 * (stats['forks_count']/10.0)
+    else:
+        score += 0.10
+    return score
+
+# The precomputed orderings of the modules listing: whether each is descending
+# and the score of modules that have no stats yet
+_sorts = OrderedDict([
+    ('relevance', (True, lambda stats, score: 1.0 if score is None else score)),
+    ('update', (False, lambda stats, score: stats.get('last_modified', float('inf')))),
+    ('stars', (True, lambda stats, score: stats.get('stargazers_count', -1))),
+    ('forks', (True, lambda stats, score: stats.get('forks_count', -1))),
+    ('name', (False, lambda stats, score: 0)),    # lexicographic by id
+])
+
+def _sortkey(sort):
+    return 'hub:sort:{}'.format(sort)
+
+def _updateSorts(conn, doc_id, stats=None, score=None):
+    """
+    Sets the module's position in each of the listing orderings, ``conn``
+    is usually a pipeline
+    """
+    stats = stats or {}
+    for sort, (_, scoreof) in _sorts.items():
+        conn.zadd(_sortkey(sort), **{doc_id.lower(): scoreof(stats, score)})
+
+def _termskey(autocomplete):
+    # All of the suggestion terms, for snapshotting the dictionary
+    return '{}:terms'.format(autocomplete.key)
+
+def _suggestionsversionkey(autocomplete):
+    # Bumped whenever terms are added to or deleted from the dictionary
+    return '{}:version'.format(autocomplete.key)
+
+def _suggestionskey(autocomplete, doc_id):
+    # A module's suggestion terms and weight
+    return '{}:module:{}'.format(autocomplete.key, doc_id)
+
+def _updateSuggestions(autocomplete, changes):
+    """
+    Incrementally updates the suggestions engine with ``changes``, a dict of
+    module ids to their new terms and relevance scores (either may be None to
+    keep the current ones). Terms are reference counted by the modules that
+    use them, weighted by the sum of these modules' scores, and deleted once
+    no module uses them. All the writes are sent in a single transaction,
+    which is retried if a concurrent update changed the state it read.
+    """
+    if not changes:
+        return
+    conn = autocomplete.redis
+    refskey = '{}:refs'.format(autocomplete.key)
+    statekeys = [_suggestionskey(autocomplete, doc_id) for doc_id in changes]
+
+    def update(pipe):
+        # Compute the deltas from the modules' previous terms and weights
+        refs = {}
+        incrs = {}
+        states = []
+        for (words, score), state in zip(changes.values(), pipe.mget(statekeys)):
+            old = json.loads(state) if state else {'terms': [], 'weight': 0.0}
+            oldterms = set(old['terms'])
+            terms = oldterms if words is None else set(words)
+            weight = (old['weight'] or 1.0) if score is None else 1.0 + score
+            for term in terms.difference(oldterms):
+                refs[term] = refs.get(term, 0) + 1
+                incrs[term] = incrs.get(term, 0.0) + weight
+            for term in oldterms.difference(terms):
+                refs[term] = refs.get(term, 0) - 1
+                incrs[term] = incrs.get(term, 0.0) - old['weight']
+            if weight != old['weight']:
+                for term in terms.intersection(oldterms):
+                    incrs[term] = incrs.get(term, 0.0) + weight - old['weight']
+            # The state of a module whose terms are all released goes with them
+            states.append(json.dumps({'terms': sorted(terms), 'weight': weight}) if terms else None)
+
+        # Terms whose last reference is removed are orphaned
+        orphaned = set()
+        released = [term for term, delta in refs.items() if delta < 0]
+        if released:
+            for term, count in zip(released, pipe.hmget(refskey, released)):
+                if int(count or 0) + refs[term] <= 0:
+                    orphaned.add(term)
+
+        pipe.multi()
+        for term, delta in refs.items():
+            if term in orphaned:
+                continue
+            if delta:
+                pipe.hincrby(refskey, term, delta)
+            if delta > 0:
+                pipe.zadd(_termskey(autocomplete), **{term: 0})
+        for term, incr in incrs.items():
+            if term not in orphaned and incr:
+                pipe.execute_command(AutoCompleter.SUGADD_COMMAND, autocomplete.key, term, incr, AutoCompleter.INCR)
+        for term in orphaned:
+            pipe.execute_command(AutoCompleter.SUGDEL_COMMAND, autocomplete.key, term)
+            pipe.hdel(refskey, term)
+            pipe.zrem(_termskey(autocomplete), term)
+        for key, state in zip(statekeys, states):
+            if state is None:
+                pipe.delete(key)
             else:
-                score += 0.10
+                pipe.set(key, state)
+        if orphaned or any(delta > 0 for delta in refs.values()):
+            pipe.incr(_suggestionsversionkey(autocomplete))
 
-            # Last release, if exists
-            rel = repo.get_releases()
-            try:
-                stats['last_release'] = {
-                    'name': rel[0].tag_name,
-                    'url': rel[0].url
-                }
-            except IndexError: # No releases
-                pass
+    # The writes apply only if no other update changed the state read meanwhile
+    conn.transaction(update, refskey, *statekeys)
 
-        self.stats = stats
-        self._sconn.add_document(self._doc_id,
-            nosave=True, replace=True,
-            score=score, name=self.name, description=self.description, **stats)
+class GithubCache(object):
+    """
+    A Redis-backed cache of Github repositories that refreshes them with
+    conditional requests, which don't count against the rate limit when the
+    repository hasn't changed
+    """
+    _conn = None
+    _gh = None
+    _statskey = 'ghcache:stats'
+
+    def __init__(self, conn, gh):
+        self._conn = conn
+        self._gh = gh
+
+    def get_key(self, repo_id):
+        return 'ghcache:{}'.format(repo_id.lower())
+
+    def get_repo(self, repo_id):
+        """
+        Returns the repository and its last release, if any
+        """
+        key = self.get_key(repo_id)
+        cached = self._conn.jsonmget(Path.rootPath(), key)[0]
+        if cached:
+            repo = self._gh.create_from_raw_data(GithubRepo, cached['data'], cached['headers'])
+            if not _retried(repo.update):   # 304 Not Modified
+                self._conn.hincrby(self._statskey, 'hits', 1)
+                return repo, cached['release']
+
+        self._conn.hincrby(self._statskey, 'misses', 1)
+        if not cached:
+            repo = _retried(self._gh.get_repo, repo_id, lazy=False)
+        release = None
+        try:
+            rel = _retried(lambda: repo.get_releases()[0])
+            release = {
+                'name': rel.tag_name,
+                'url': rel.url
+            }
+        except IndexError: # No releases
+            pass
+
+        headers = repo.raw_headers
+        self._conn.jsonset(key, Path.rootPath(), {
+            'data': repo.raw_data,
+            'headers': dict((h, headers[h]) for h in ('etag', 'last-modified') if h in headers),
+            'release': release,
+        })
+        return repo, release
+
+    def stats(self):
+        """
+        Returns the cache's hit and miss counters
+        """
+        stats = self._conn.hgetall(self._statskey)
+        return {
+            'hits': int(stats.get('hits', 0)),
+            'misses': int(stats.get('misses', 0)),
+        }
 
 """
 Exported Functions
 """
 
+_hub = None
+_jobttl = 60*60     # the longest a job is expected to run or stay pending
+
+# Releases a lock only if it is still held by the token
+_unlock = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def _jobkey(kind, job_id):
+    return 'hub:job:{}:{}'.format(kind, job_id)
+
+def _loadJobId(name, path, filenames=None):
+    job_id = 'load:{}:{}'.format(name, path)
+    if filenames:
+        job_id += ':{}'.format(','.join(sorted(filenames)))
+    return job_id
+
+def _exclusive(idof, defer=None):
+    """
+    Runs the job only once at a time per id, which ``idof`` makes of its
+    arguments. Starting it clears its pending mark so requests made since
+    get another run. A run that finds its id already running is skipped, or
+    deferred by ``defer`` seconds if given.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            job_id = idof(*args, **kwargs)
+            conn = getHub().qconn
+            conn.delete(_jobkey('pending', job_id))
+            lock, token = _jobkey('lock', job_id), uuid.uuid4().hex
+            if not conn.set(lock, token, nx=True, ex=_jobttl):
+                if defer and conn.set(_jobkey('pending', job_id), 1, nx=True, ex=_jobttl):
+                    logger.info('Job {} is already running, deferring it'.format(job_id))
+                    _scheduler(conn).enqueue_in(timedelta(seconds=defer), wrapper, *args, **kwargs)
+                else:
+                    logger.info('Job {} is already running, skipping it'.format(job_id))
+                return None
+            try:
+                return func(*args, **kwargs)
+            finally:
+                conn.eval(_unlock, 1, lock, token)
+        return wrapper
+    return decorator
+
+def _measured(func):
+    """
+    Records the calls made by a job and adds them to the totals kept in
+    the queue's Redis
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics.start(shared=True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            unit = metrics.stop(func.__name__)
+            logger.info('{} took {:.3f}ms ({})'.format(func.__name__, unit['duration'], metrics.server_timing(unit)))
+            if _hub is not None:
+                try:
+                    metrics.save(_hub.qconn, func.__name__, unit)
+                except RedisError as e:
+                    logger.warning('Could not save the metrics of {}: {}'.format(func.__name__, e))
+    return wrapper
+
+def getHub():
+    """
+    Returns the process' hub, constructing it on first use or when its
+    connections had failed the health check
+    """
+    global _hub
+    if _hub is not None:
+        try:
+            _hub.ping()
+        except RedisError as e:
+            logger.warning('Discarding unhealthy hub: {}'.format(e))
+            _hub = None
+            _connections.clear()
+
+    if _hub is None:
+        _hub, duration = _durationms(Hub)
+        logger.info('Hub constructed in {:.3f}ms'.format(duration))
+    else:
+        _hub.resolveIndex()
+    return _hub
+
+def warmup():
+    """
+    Prepares a worker process before it takes jobs: imports the queueing
+    dependencies, then constructs and connects the process' hub
+    """
+    import rq
+    import rq_scheduler
+    _, duration = _durationms(lambda: getHub().warmup())
+    logger.info('Warmed up in {:.3f}ms'.format(duration))
+
+@_measured
+@_exclusive(lambda docId: 'stats:{}'.format(docId.lower()))
 def callRedisModuleUpateStats(docId):
     logger.info('Calling update stats for {}'.format(docId))
-    hub = Hub()
+    hub = getHub()
     if hub.gh:
         module = RedisModule(hub.dconn, hub.sconn, hub.autocomplete, docId)
-        module.updateStats(hub.gh)
+        try:
+            with hub.ghpool.client(low=True) as gh:
+                module.updateStats(GithubCache(hub.dconn, gh))
+        except GithubQuotaError as e:
+            logger.warning('Skipping the stats update of {}: {}'.format(docId, e))
     else:
         logger.error('No Github access for updating stats {}'.format(docId))
 
-def callLoadModulesFromRepo(name, path):
+@_measured
+@_exclusive(lambda: 'stats:catalog')
+def callRefreshStats():
+    logger.info('Calling refresh stats')
+    hub = getHub()
+    if hub.gh:
+        hub.refreshStats()
+    else:
+        logger.error('No Github access for refreshing stats')
+
+@_measured
+@_exclusive(lambda: 'index:rebuild')
+def callRebuildIndex():
+    logger.info('Calling rebuild index')
+    getHub().rebuildIndex()
+
+@_measured
+def callDropIndex(name):
+    logger.info('Calling drop index {}'.format(name))
+    getHub().dropIndex(name)
+
+@_measured
+@_exclusive(_loadJobId, defer=60)
+def callLoadModulesFromRepo(name, path, filenames=None):
     logger.info('Calling load modules from github {} {}'.format(name, path))
-    hub = Hub()
+    hub = getHub()
     if hub.gh:
-        hub.loadModulesFromRepo(name, path)
+        hub.loadModulesFromRepo(name, path, filenames)
     else:
         logger.error('No Github access for loading {} {}'.format(name, path))
 
+@_measured
+@_exclusive(lambda repoid: 'submission:{}'.format(repoid))
 def callProcessSubmission(repoid):
     logger.info('Calling process module submission {}'.format(repoid))
-    hub = Hub()
+    hub = getHub()
     if hub.gh:
         hub.processSubmission(repoid)
     else:
@@ -0,0 +1,48 @@
+"""
+Maintenance commands of the hub
+
+Commands are enqueued as jobs for the workers to run, unless ``--now`` runs
+them in this process.
+"""
+import argparse
+
+from rmhub import Hub, _durationms, logger
+
+
+def rebuild_index(hub, now=False):
+    if now:
+        name, duration = _durationms(hub.rebuildIndex)
+        logger.info('Rebuilt the index as {} in {:.3f}ms'.format(name, duration))
+    else:
+        logger.info('Enqueued job {}'.format(hub.scheduleIndexRebuild()))
+
+
+def schedule_stats(hub, now=False):
+    if now:
+        batches, duration = _durationms(hub.refreshStats)
+        logger.info('Refreshed stats in {} batches in {:.3f}ms'.format(len(batches), duration))
+    else:
+        # Also cancels the per-module jobs of older hubs
+        hub.scheduleStatsRefresh()
+        logger.info('Scheduled the hourly stats refresh')
+
+
+commands = {
+    'rebuild-index': rebuild_index,
+    'schedule-stats': schedule_stats,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs maintenance commands of the hub')
+    parser.add_argument('command', choices=sorted(commands))
+    parser.add_argument('--now', action='store_true',
+                        help='run the command here instead of enqueuing it')
+    args = parser.parse_args(argv)
+
+    hub = Hub(bootstrap=False)
+    commands[args.command](hub, args.now)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Lightweight instrumentation of the hub's Redis and Github calls
+
+Connections record the commands, round trips and wall time of their calls
+in the current unit of work, which is a web request or a job. Units are
+aggregated by name into per-process totals. Calls slower than the
+`SLOW_CALL_MS` environment variable are logged.
+"""
+import logging
+import os
+import threading
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+try:
+    from time import monotonic as clock
+except ImportError:     # Python 2 has the backport
+    from monotonic import monotonic as clock
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_CALL_MS = float(os.environ.get('SLOW_CALL_MS', 0))
+
+_local = threading.local()
+_shared = None  # a unit of work shared by all threads, e.g. a job's
+_totals = {}
+_lock = threading.Lock()
+
+
+def _counters():
+    return {
+        'calls': 0,
+        'commands': 0,
+        'round_trips': 0,
+        'duration': 0.0,
+    }
+
+
+def start(shared=False):
+    """
+    Starts a unit of work in the current thread (or greenlet), or one that
+    is shared with the threads it spawns
+    """
+    global _shared
+    unit = {'started': clock(), 'services': {}}
+    if shared:
+        _shared = unit
+    else:
+        _local.unit = unit
+
+
+def _current():
+    return getattr(_local, 'unit', None) or _shared
+
+
+def record(service, commands=0, round_trips=0, duration=0.0, calls=0):
+    unit = _current()
+    if unit is None:
+        return
+    with _lock:
+        counters = unit['services'].setdefault(service, _counters())
+        counters['calls'] += calls
+        counters['commands'] += commands
+        counters['round_trips'] += round_trips
+        counters['duration'] += duration * 1000.0
+
+
+def stop(name):
+    """
+    Ends the current unit of work, adds it to the totals of ``name`` and
+    returns its duration and counters by service
+    """
+    global _shared
+    unit = _current()
+    if unit is None:
+        return None
+    if unit is _shared:
+        _shared = None
+    else:
+        _local.unit = None
+    unit['duration'] = (clock() - unit.pop('started')) * 1000.0
+
+    with _lock:
+        total = _totals.setdefault(name, {'count': 0, 'duration': 0.0, 'services': {}})
+        total['count'] += 1
+        total['duration'] += unit['duration']
+        for service, counters in unit['services'].items():
+            totals = total['services'].setdefault(service, _counters())
+            for k, v in counters.items():
+                totals[k] += v
+    return unit
+
+
+def totals():
+    with _lock:
+        return dict(_totals)
+
+
+def save(conn, name, unit, prefix='metrics'):
+    """
+    Adds a unit of work to the totals of ``name`` kept in Redis, so they
+    outlive the process that did the work (e.g. a worker's jobs)
+    """
+    key = '{}:{}'.format(prefix, name)
+    pipe = conn.pipeline(transaction=False)
+    pipe.sadd(prefix, name)
+    pipe.hincrby(key, 'count', 1)
+    pipe.hincrbyfloat(key, 'duration', unit['duration'])
+    for service, counters in unit['services'].items():
+        for k, v in counters.items():
+            if isinstance(v, float):
+                pipe.hincrbyfloat(key, '{}.{}'.format(service, k), v)
+            else:
+                pipe.hincrby(key, '{}.{}'.format(service, k), v)
+    pipe.execute()
+
+
+def load(conn, prefix='metrics'):
+    """
+    Returns the totals saved in Redis, by name
+    """
+    names = sorted(conn.smembers(prefix))
+    pipe = conn.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall('{}:{}'.format(prefix, name))
+    loaded = {}
+    for name, fields in zip(names, pipe.execute()):
+        total = {'count': 0, 'duration': 0.0, 'services': {}}
+        for field, value in fields.items():
+            if '.' in field:
+                service, k = field.split('.', 1)
+                total['services'].setdefault(service, _counters())[k] = float(value) if k == 'duration' else int(value)
+            else:
+                total[field] = float(value) if field == 'duration' else int(value)
+        loaded[name] = total
+    return loaded
+
+
+def server_timing(unit):
+    """
+    Formats a unit of work as a `Server-Timing` header value
+    """
+    metrics = []
+    for service, counters in sorted(unit['services'].items()):
+        metrics.append('{};desc="{} commands, {} round trips, {} calls";dur={:.3f}'.format(
+            service, counters['commands'], counters['round_trips'], counters['calls'],
+            counters['duration']))
+    metrics.append('total;dur={:.3f}'.format(unit['duration']))
+    return ', '.join(metrics)
+
+
+def _slow(service, what, duration):
+    if SLOW_CALL_MS and duration * 1000.0 > SLOW_CALL_MS:
+        logger.warning('Slow {} call {} took {:.3f}ms'.format(service, what, duration * 1000.0))
+
+
+class Instrumented(object):
+    """
+    Mixin of a Redis connection class that records its calls under the
+    ``service`` name, see instrumented()
+    """
+    def __init__(self, service='redis', **kwargs):
+        super(Instrumented, self).__init__(**kwargs)
+        self.service = service
+        self._commands = 0
+        self._command = None
+
+    def pack_command(self, *args):
+        self._commands += 1
+        self._command = args[0]
+        return super(Instrumented, self).pack_command(*args)
+
+    def send_packed_command(self, command):
+        start = clock()
+        try:
+            return super(Instrumented, self).send_packed_command(command)
+        finally:
+            record(self.service, commands=self._commands, round_trips=1,
+                   duration=clock() - start)
+            self._commands = 0
+
+    def read_response(self):
+        start = clock()
+        try:
+            return super(Instrumented, self).read_response()
+        finally:
+            duration = clock() - start
+            record(self.service, duration=duration)
+            _slow(self.service, self._command, duration)
+
+
+_instrumented = {}
+
+
+def instrumented(cls):
+    """
+    Returns the instrumented subclass of the Redis connection class ``cls``,
+    e.g. of the SSL or Unix socket connection a URL's scheme calls for
+    """
+    if cls not in _instrumented:
+        _instrumented[cls] = type('Instrumented{}'.format(cls.__name__), (Instrumented, cls), {})
+    return _instrumented[cls]
+
+
+class InstrumentedHTTPSConnection(httplib.HTTPSConnection):
+    """
+    An HTTPS connection that records the Github API calls made through it
+    """
+    _started = None
+    _url = None
+
+    def request(self, method, url, *args, **kwargs):
+        self._started = clock()
+        self._url = '{} {}'.format(method, url)
+        return httplib.HTTPSConnection.request(self, method, url, *args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        try:
+            return httplib.HTTPSConnection.getresponse(self, *args, **kwargs)
+        finally:
+            if self._started is not None:
+                duration = clock() - self._started
+                record('github', calls=1, round_trips=1, duration=duration)
+                _slow('github', self._url, duration)
+                self._started = None
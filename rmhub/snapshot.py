@@ -0,0 +1,167 @@
+"""
+Streaming snapshots of the hub's catalog
+
+A snapshot is a newline-delimited stream of JSON records: the catalog, then
+every module's document with its suggestion terms and weight, and then the
+cached Github repositories. Importing one warms an empty database without
+any calls to Github.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from rejson import Path
+
+from rmhub import (GithubCache, Hub, RedisModule, _durationms, _scoreof, _suggestionskey,
+                   _toepoch, _updateSorts, _updateSuggestions, logger)
+
+
+def export_snapshot(hub, out, batch_size=100):
+    """
+    Writes the hub's snapshot to the ``out`` file-like object, reading
+    ``batch_size`` modules at a time
+    """
+    catalog = hub.dconn.jsonget(hub._hubkey)
+    added = dict(hub.dconn.zrange(hub._modskey, 0, -1, withscores=True))
+    doc_ids = sorted(added.keys())
+    _write(out, {
+        'type': 'catalog',
+        'created': catalog['created'],
+        'submit_enabled': catalog['submit_enabled'],
+    })
+
+    repo_ids = []
+    count = 0
+    for i in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[i:i + batch_size]
+        docs = hub.dconn.jsonmget(Path.rootPath(), *[RedisModule.keyof(doc_id) for doc_id in batch])
+        states = hub.autocomplete.redis.mget([_suggestionskey(hub.autocomplete, doc_id) for doc_id in batch])
+        for doc_id, doc, state in zip(batch, docs, states):
+            if doc is None:
+                continue
+            _write(out, {
+                'type': 'module',
+                'id': doc_id,
+                'added': added[doc_id],
+                'document': doc,
+                'suggestions': json.loads(state) if state else None,
+            })
+            count += 1
+            repository = doc.get('repository') or {}
+            if repository.get('type') == 'github' and 'id' in repository:
+                repo_ids.append(repository['id'])
+
+    ghcache = GithubCache(hub.dconn, None)
+    for i in range(0, len(repo_ids), batch_size):
+        batch = repo_ids[i:i + batch_size]
+        cached = hub.dconn.jsonmget(Path.rootPath(), *[ghcache.get_key(repo_id) for repo_id in batch])
+        for repo_id, data in zip(batch, cached):
+            if data is not None:
+                _write(out, {
+                    'type': 'ghcache',
+                    'id': repo_id,
+                    'data': data,
+                })
+    return count
+
+
+def import_snapshot(hub, infile, batch_size=100):
+    """
+    Loads a snapshot from the ``infile`` file-like object into the hub,
+    writing ``batch_size`` records at a time
+    """
+    created = None
+    if hub.dconn.exists(hub._hubkey):
+        created = hub.dconn.jsonget(hub._hubkey, Path('.created'))
+    modules = []
+    count = 0
+    pipe = hub.dconn.pipeline(transaction=False)
+    pending = 0
+    for line in infile:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record['type'] == 'catalog':
+            if created is None:
+                hub.createHub()
+            created = record['created']
+            hub.dconn.jsonset(hub._hubkey, Path('.created'), created)
+            hub.dconn.jsonset(hub._hubkey, Path('.submit_enabled'), record['submit_enabled'])
+        elif record['type'] == 'module':
+            if created is None:
+                raise ValueError('Snapshot has no catalog record and the hub does not exist')
+            modules.append(record)
+            if len(modules) == batch_size:
+                count += _importModules(hub, modules)
+                modules = []
+        elif record['type'] == 'ghcache':
+            pipe.jsonset(GithubCache(hub.dconn, None).get_key(record['id']), Path.rootPath(), record['data'])
+            pending += 1
+            if pending == batch_size:
+                pipe.execute()
+                pending = 0
+    if modules:
+        count += _importModules(hub, modules)
+    if pending:
+        pipe.execute()
+
+    hub.dconn.incr(RedisModule._genkey)
+    return count
+
+
+def _importModules(hub, records):
+    now = _toepoch(datetime.utcnow())
+    pipe = hub.dconn.pipeline(transaction=False)
+    indexer = hub.indexWriter(batched=True)
+    suggestions = {}
+    for record in records:
+        doc_id, doc = record['id'], record['document']
+        state = record['suggestions'] or {}
+        stats = doc.get('stats')
+        score = _scoreof(stats) if stats else 1.0
+
+        pipe.jsonset(RedisModule.keyof(doc_id), Path.rootPath(), doc)
+        pipe.set(RedisModule.blobof(doc_id), json.dumps(doc))
+        _updateSorts(pipe, doc_id, stats, score)
+        pipe.zadd(hub._modskey, **{doc_id: record.get('added', now)})
+        indexer.add_document(doc_id, nosave=True, replace=True, score=score,
+            name=doc['name'], description=doc['description'], **(stats or {}))
+        suggestions[doc_id] = (state.get('terms', RedisModule.suggestionsof(doc)),
+                               score if stats else None)
+    pipe.execute()
+    indexer.commit()
+    _updateSuggestions(hub.autocomplete, suggestions)
+    return len(records)
+
+
+def _write(out, record):
+    out.write(json.dumps(record))
+    out.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exports and imports snapshots of the hub')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('-f', '--file', default='-',
+                        help='snapshot file, defaults to stdout/stdin')
+    parser.add_argument('-b', '--batch-size', type=int, default=100,
+                        help='number of records per batch')
+    args = parser.parse_args(argv)
+
+    hub = Hub(bootstrap=False)
+    if args.command == 'export':
+        out = sys.stdout if args.file == '-' else open(args.file, 'w')
+        with out:
+            count, duration = _durationms(export_snapshot, hub, out, args.batch_size)
+        logger.info('Exported {} modules in {:.3f}ms'.format(count, duration))
+    else:
+        infile = sys.stdin if args.file == '-' else open(args.file)
+        with infile:
+            count, duration = _durationms(import_snapshot, hub, infile, args.batch_size)
+        hub.scheduleStatsRefresh()
+        logger.info('Imported {} modules in {:.3f}ms'.format(count, duration))
+
+
+if __name__ == '__main__':
+    main()
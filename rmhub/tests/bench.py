@@ -0,0 +1,330 @@
+"""
+Benchmarks of the hub's hot paths
+
+Seeds a Redis that has the RediSearch and ReJSON modules loaded with
+synthetic modules scaled up from the `modules/*.json` fixtures, stubs Github
+with a local fake and reports the latency percentiles and Redis round trips
+of every measured path. The database is flushed, so don't point it at
+anything you care about.
+
+    python -m rmhub.tests.bench --url redis://localhost:6379/0 --modules 2000
+"""
+import argparse
+import copy
+import glob
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from github import GithubException
+from redis import ConnectionPool, Redis, ResponseError, StrictRedis
+from redis.connection import Connection
+from rejson import Client as ReJSONClient
+from rejson import Path
+
+import rmhub
+from rmhub import GithubCache, GithubPool, Hub, RedisModule
+
+FIXTURES = '{}/../../modules'.format(os.path.dirname(os.path.realpath(__file__)))
+SORTS = ['relevance', 'update', 'stars', 'forks', 'name']
+
+
+class CountingConnection(Connection):
+    """
+    A connection that counts the round trips made through it: a pipeline is
+    sent as a single packed command
+    """
+    round_trips = 0
+
+    def send_packed_command(self, command):
+        CountingConnection.round_trips += 1
+        return Connection.send_packed_command(self, command)
+
+
+class FakeRelease(object):
+    def __init__(self, name, url):
+        self.tag_name = name
+        self.url = url
+
+
+class FakeOwner(object):
+    def __init__(self, login):
+        self.login = login
+
+
+class FakeCommit(object):
+    def __init__(self, sha):
+        self.sha = sha
+
+
+class FakeBranch(object):
+    def __init__(self, name):
+        self.name = name
+        self.commit = FakeCommit('0' * 40)
+
+
+class FakeRef(object):
+    ref = None  # yet to be created
+
+    def edit(self, sha, force=False):
+        pass
+
+
+class FakePull(object):
+    def __init__(self, number, url):
+        self.number = number
+        self.html_url = url
+
+
+class FakeIssue(object):
+    def edit(self, labels=None):
+        pass
+
+
+class FakeRepo(object):
+    """
+    A Github repository with stable, made up stats that never changes. The
+    calls of the submission steps are recorded in its ``gh``, and fail if
+    it is set to fail them.
+    """
+    default_branch = 'master'
+    gh = None
+
+    def __init__(self, raw_data, headers=None):
+        self.raw_data = raw_data
+        self.raw_headers = headers or {'etag': '"{}"'.format(raw_data['id'])}
+
+    @classmethod
+    def of(cls, full_name):
+        seed = zlib.crc32(full_name.encode('utf-8')) & 0xffffffff
+        pushed_at = datetime.today() - timedelta(days=seed % 365)
+        return cls({
+            'id': seed,
+            'full_name': full_name,
+            'description': 'A fake repository',
+            'owner': {'login': full_name.split('/')[0]},
+            'stargazers_count': seed % 1000,
+            'forks_count': seed % 50,
+            'pushed_at': pushed_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+
+    @property
+    def stargazers_count(self):
+        return self.raw_data['stargazers_count']
+
+    @property
+    def forks_count(self):
+        return self.raw_data['forks_count']
+
+    @property
+    def pushed_at(self):
+        return datetime.strptime(self.raw_data['pushed_at'], '%Y-%m-%dT%H:%M:%SZ')
+
+    @property
+    def description(self):
+        return self.raw_data['description']
+
+    @property
+    def owner(self):
+        return FakeOwner(self.raw_data['owner']['login'])
+
+    def update(self):
+        return False    # 304 Not Modified
+
+    def get_releases(self):
+        return [FakeRelease('v1.0.0', 'https://github.com/{}/releases/v1.0.0'.format(self.raw_data['full_name']))]
+
+    def _call(self, name):
+        if self.gh is not None:
+            self.gh.calls.append(name)
+            if name == self.gh.fail:
+                raise GithubException(500, {'message': 'Failing {}'.format(name)})
+
+    def get_branch(self, name):
+        self._call('get_branch')
+        return FakeBranch(name)
+
+    def get_git_ref(self, ref):
+        self._call('get_git_ref')
+        return FakeRef()
+
+    def create_git_ref(self, ref, sha):
+        self._call('create_git_ref')
+        return FakeRef()
+
+    def get_pulls(self, head=None):
+        self._call('get_pulls')
+        return []
+
+    def get_git_commit(self, sha):
+        self._call('get_git_commit')
+        return FakeCommit(sha)
+
+    def get_git_tree(self, sha):
+        self._call('get_git_tree')
+        return sha
+
+    def create_git_tree(self, elems, base_tree=None):
+        self._call('create_git_tree')
+        return base_tree
+
+    def create_git_commit(self, message, tree, parents):
+        self._call('create_git_commit')
+        return FakeCommit('1' * 40)
+
+    def get_pull(self, number):
+        self._call('get_pull')
+        return FakePull(number, 'https://github.com/{}/pull/{}'.format(self.raw_data['full_name'], number))
+
+    def create_pull(self, title, body, head, base):
+        self._call('create_pull')
+        return self.get_pull(1)
+
+    def get_issue(self, number):
+        self._call('get_issue')
+        return FakeIssue()
+
+
+class FakeGithub(object):
+    rate_limiting = (5000, 5000)
+    rate_limiting_resettime = 0
+
+    def __init__(self, fail=None):
+        self.fail = fail    # the name of the repository call to fail
+        self.calls = []
+
+    def get_repo(self, full_name, lazy=True):
+        repo = FakeRepo.of(full_name)
+        repo.gh = self
+        return repo
+
+    def create_from_raw_data(self, klass, raw_data, headers={}):
+        return FakeRepo(raw_data, headers)
+
+
+def synthetic_modules(count):
+    fixtures = []
+    for filename in sorted(glob.glob('{}/*.json'.format(FIXTURES))):
+        with open(filename) as fp:
+            fixtures.append(json.load(fp))
+
+    mods = []
+    for i in range(count):
+        mod = copy.deepcopy(fixtures[i % len(fixtures)])
+        mod['name'] = '{}-{}'.format(mod['name'], i)
+        repository = mod['repository']
+        repository['id'] = '{}-{}'.format(repository['id'], i)
+        repository['url'] = 'https://github.com/{}'.format(repository['id'])
+        mods.append(mod)
+    return mods
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def measure(label, func, args_list, setup=None):
+    """
+    Calls ``func`` with each of ``args_list``, returning the label, the p50
+    and p99 latencies in ms and the average round trips per call
+    """
+    latencies = []
+    round_trips = 0
+    for args in args_list:
+        if setup:
+            setup()
+        before = CountingConnection.round_trips
+        start = time.time()
+        func(*args)
+        latencies.append((time.time() - start) * 1000.0)
+        round_trips += CountingConnection.round_trips - before
+    return (label, percentile(latencies, 50), percentile(latencies, 99),
+            float(round_trips) / len(args_list))
+
+
+def connect(url):
+    # Pre-populate the hub's connection registry with counting connections
+    for cls in (ReJSONClient, Redis, StrictRedis):
+        pool = ConnectionPool.from_url(url, connection_class=CountingConnection)
+        rmhub._connections[(cls, url)] = cls(connection_pool=pool)
+
+
+def run(url, count, iterations, out):
+    connect(url)
+    conn = rmhub._connections[(StrictRedis, url)]
+    conn.flushdb()
+
+    def newhub():
+        hub = Hub(docs_url=url, search_url=url, queue_url=url, repo='bench/hub', bootstrap=False)
+        hub.gh = FakeGithub()
+        hub.ghpool = GithubPool(hub.dconn, {'bench': hub.gh})
+        hub.ghcache = GithubCache(hub.dconn, hub.gh)
+        return hub
+
+    hub = newhub()
+    try:
+        hub.createHub()
+    except ResponseError as e:
+        out.write('The Redis at {} needs the RediSearch and ReJSON modules: {}\n'.format(url, e))
+        return False
+    mods = synthetic_modules(count)
+    start = time.time()
+    for i in range(0, len(mods), 100):
+        hub.addModules(mods[i:i + 100])
+    out.write('Seeded {} modules in {:.3f}ms\n'.format(count, (time.time() - start) * 1000.0))
+    start = time.time()
+    hub.refreshStats()
+    out.write('Refreshed their stats in {:.3f}ms\n\n'.format((time.time() - start) * 1000.0))
+
+    results = []
+    results.append(measure('Hub()', newhub, [()] * iterations))
+    for sort in SORTS:
+        results.append(measure('viewModules({}) uncached'.format(sort), hub.viewModules,
+                               [(None, sort)] * iterations, setup=hub.results.clear))
+        results.append(measure('viewModules({}) cached'.format(sort), hub.viewModules,
+                               [(None, sort)] * iterations))
+    results.append(measure('viewModulesBlob', hub.viewModulesBlob,
+                           [(None,)] * iterations, setup=hub.results.clear))
+    results.append(measure('viewModules(query)', hub.viewModules,
+                           [('bloom', 'relevance')] * iterations, setup=hub.results.clear))
+    prefixes = ['re', 'red', 'graph', 'bl', 'json', 'ti', 'cu', 'to']
+    results.append(measure('viewSearchSuggestions uncached', hub.viewSearchSuggestions,
+                           [(prefixes[i % len(prefixes)],) for i in range(iterations)],
+                           setup=hub.suggestions.clear))
+    extra = synthetic_modules(count + iterations)[count:]
+    results.append(measure('addModule', hub.addModule, [(mod,) for mod in extra]))
+    # Clear the stats the refresh stored, so the updates write them rather
+    # than return early
+    pipe = hub.dconn.pipeline(transaction=False)
+    for mod in mods[:iterations]:
+        pipe.jsondel(RedisModule.keyof(mod['name']), Path('.stats'))
+    pipe.execute()
+    results.append(measure('updateStats', lambda mod: RedisModule(
+        hub.dconn, hub.sconn, hub.autocomplete, mod['name']).updateStats(hub.ghcache),
+        [(mod,) for mod in mods[:iterations]]))
+
+    out.write('{:<40} {:>10} {:>10} {:>12}\n'.format('path', 'p50 ms', 'p99 ms', 'round trips'))
+    for label, p50, p99, round_trips in results:
+        out.write('{:<40} {:>10.3f} {:>10.3f} {:>12.1f}\n'.format(label, p50, p99, round_trips))
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the hub against a local Redis')
+    parser.add_argument('--url', default='redis://localhost:6379/0',
+                        help='Redis with RediSearch and ReJSON, it is flushed')
+    parser.add_argument('--modules', type=int, default=2000,
+                        help='number of synthetic modules to seed')
+    parser.add_argument('--iterations', type=int, default=100,
+                        help='calls per measured path')
+    args = parser.parse_args(argv)
+    if not run(args.url, args.modules, args.iterations, sys.stdout):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,240 @@
+import os
 from unittest import TestCase
+from urlparse import urlparse, urlunparse
 from rmhub import Hub
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
+def scratchUrl(db=15):
+    # The URL of a database of the hub's Redis that tests may flush
+    parts = urlparse(os.environ['DOCS_REDIS_URL'])
+    return urlunparse(parts._replace(path='/{}'.format(db)))
+
 class TestRMHub(TestCase):
     def testHubCreation(self):
         hub = Hub()
-        self.assertIsNotNone(hub)
\ No newline at end of file
+        self.assertIsNotNone(hub)
+
+    def testGetModulesSkipsMissing(self):
+        hub = Hub()
+        self.assertEqual([], hub.getModules([]))
+        self.assertEqual([], hub.getModules(['no/such-module']))
+
+    def testAddModulesTwice(self):
+        hub = Hub()
+        mod = {'name': 'test/reloaded', 'description': 'loaded twice'}
+        self.addCleanup(hub.removeModule, mod['name'])
+        hub.addModules([mod])
+        self.assertEqual(1, len(hub.addModules([mod])))
+        self.assertEqual(1, hub.sconn.search('loaded twice').total)
+
+    def testGetHubIsShared(self):
+        from rmhub import getHub
+        hub = getHub()
+        self.assertIs(hub, getHub())
+        self.assertTrue(hub.ping())
+
+    def testReJSONObjectSnapshot(self):
+        from rmhub import ReJSONObject
+        hub = Hub()
+        hub.dconn.jsonset('test:snapshot', '.', {'name': 'foo'})
+        obj = ReJSONObject(hub.dconn, 'test:snapshot').snapshot()
+        hub.dconn.jsonset('test:snapshot', '.name', 'bar')
+        self.assertEqual('foo', obj.name)
+        with obj.batched():
+            obj.name = 'baz'
+            obj.status = 'new'
+        obj.invalidate()
+        self.assertEqual('baz', obj.name)
+        self.assertEqual('new', obj.status)
+        obj.snapshot('name', 'missing')
+        self.assertEqual('baz', obj.name)
+        self.assertIsNone(obj.missing)
+        self.assertRaises(AttributeError, getattr, obj, 'status')
+        hub.dconn.delete('test:snapshot')
+
+    def testViewModulesPagingAndFields(self):
+        hub = Hub()
+        res = hub.viewModules(offset=0, limit=1, fields=['name'])
+        self.assertLessEqual(len(res['modules']), 1)
+        for mod in res['modules']:
+            self.assertEqual(['name'], list(mod.keys()))
+
+    def testViewModulesCache(self):
+        hub = Hub()
+        hub.viewModules(query='Redis  Graph')
+        self.assertTrue(hub.viewModules(query='redis graph').get('cached'))
+        hub.dconn.incr('hub:generation')
+        self.assertFalse(hub.viewModules(query='redis graph').get('cached'))
+
+    def testIncrementalSuggestions(self):
+        from rmhub import AutoCompleter, _updateSuggestions
+        hub = Hub()
+        ac = AutoCompleter('test:ac', conn=hub.autocomplete.redis)
+        _updateSuggestions(ac, {'a': (set(['graph', 'json']), None), 'b': (set(['graph']), None)})
+        _updateSuggestions(ac, {'a': (set(['graph']), 0.5)})
+        self.assertEqual(['graph'], [s.string for s in ac.get_suggestions('gr')])
+        self.assertEqual([], [s.string for s in ac.get_suggestions('json')])
+        version = hub.autocomplete.redis.get('test:ac:version')
+        _updateSuggestions(ac, {'b': (None, 0.2)})
+        self.assertEqual(version, hub.autocomplete.redis.get('test:ac:version'))
+        _updateSuggestions(ac, {'a': (set(), None), 'b': (set(), None)})
+        self.assertEqual(0, ac.len())
+        self.assertFalse(hub.autocomplete.redis.exists('test:ac:module:a'))
+        hub.autocomplete.redis.delete('test:ac', 'test:ac:refs', 'test:ac:terms', 'test:ac:version',
+                                      'test:ac:module:a', 'test:ac:module:b')
+
+    def testSnapshotRoundTrip(self):
+        from StringIO import StringIO
+        from rmhub.snapshot import export_snapshot, import_snapshot
+        hub = Hub()
+        out = StringIO()
+        count = export_snapshot(hub, out)
+        # Imported into a scratch database of the hub's Redis
+        url = scratchUrl()
+        scratch = Hub(docs_url=url, search_url=url, queue_url=url, bootstrap=False)
+        scratch.dconn.flushdb()
+        self.addCleanup(scratch.dconn.flushdb)
+        self.assertEqual(count, import_snapshot(scratch, StringIO(out.getvalue())))
+        self.assertEqual(count, scratch.dconn.zcard('hub:modules'))
+
+    def testMetricsCountsRoundTrips(self):
+        from rmhub import metrics
+        hub = Hub()
+        metrics.start()
+        pipe = hub.qconn.pipeline(transaction=False)
+        pipe.ping()
+        pipe.ping()
+        pipe.execute()
+        unit = metrics.stop('test')
+        self.assertEqual(2, unit['services']['queue']['commands'])
+        self.assertEqual(1, unit['services']['queue']['round_trips'])
+        self.assertIn('queue;desc=', metrics.server_timing(unit))
+
+    def testInstrumentedUnixSocketConnection(self):
+        from redis.connection import UnixDomainSocketConnection
+        from rmhub import _connection
+        conn = _connection('unix:///tmp/test.sock', service='test')
+        connection = conn.connection_pool.make_connection()
+        self.assertIsInstance(connection, UnixDomainSocketConnection)
+        self.assertEqual('test', connection.service)
+
+    def testListingOrderings(self):
+        hub = Hub()
+        mods = hub.viewModules(sort='stars')['modules']
+        stars = [mod.get('stats', {}).get('stargazers_count', -1) for mod in mods]
+        self.assertEqual(sorted(stars, reverse=True), stars)
+        self.assertEqual(hub.dconn.zcard('hub:sort:name'), hub.viewModules(sort='name')['results'])
+
+    def testBackfilledSortsCoverCatalog(self):
+        hub = Hub()
+        hub.backfillSorts()
+        self.assertEqual(hub.dconn.zcard('hub:modules'), hub.dconn.zcard('hub:sort:relevance'))
+
+    def testGithubPoolReservesQuota(self):
+        import time
+        from rmhub import GithubPool, GithubQuotaError
+        hub = Hub()
+        pool = GithubPool(hub.dconn, {'test': None}, reserve=10)
+        pool._key = 'test:ghquota'
+        hub.dconn.hset(pool._key, 'test', '{{"remaining": 5, "reset": {}}}'.format(time.time() + 60))
+        self.assertEqual('test', pool.acquire()[0])
+        self.assertRaises(GithubQuotaError, pool.acquire, True)
+        hub.dconn.delete(pool._key)
+
+    def testEnqueueCoalescesPendingJobs(self):
+        from rmhub import _jobkey
+        hub = Hub()
+        hub._queuename = 'test'
+        self.deleteQueue(hub, 'test', _jobkey('pending', 'test:job'))
+        self.addCleanup(self.deleteQueue, hub, 'test', _jobkey('pending', 'test:job'))
+        hub.enqueue('test:job', 'os.getpid')
+        hub.enqueue('test:job', 'os.getpid')
+        self.assertEqual(1, hub.qconn.llen('rq:queue:test'))
+
+    def deleteQueue(self, hub, name, *keys):
+        job_ids = hub.qconn.lrange('rq:queue:{}'.format(name), 0, -1)
+        hub.qconn.delete('rq:queue:{}'.format(name), *(list(keys) + ['rq:job:{}'.format(job_id) for job_id in job_ids]))
+        hub.qconn.srem('rq:queues', 'rq:queue:{}'.format(name))
+
+    def testSubmissionStatusIsPublished(self):
+        from rmhub import Submission
+        hub = Hub()
+        submission = Submission(hub.dconn, 'test/published')
+        submission.save()
+        pubsub = hub.dconn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(Submission.channelof('test/published'))
+        submission.set_status('started', 'Testing')
+        message = pubsub.get_message(timeout=1)
+        self.assertIn('"started"', message['data'])
+        submission.message = 'Testing a step'
+        message = pubsub.get_message(timeout=1)
+        self.assertIn('Testing a step', message['data'])
+        pubsub.close()
+        hub.dconn.delete(submission.get_key())
+
+    def testSubmissionResumesAfterCompletedSteps(self):
+        from github import GithubException
+        from rmhub import Submission
+        from rmhub.tests.bench import FakeGithub
+        hub = Hub()
+        submission = Submission(hub.dconn, 'test/resumable')
+        submission.save()
+        self.addCleanup(hub.dconn.delete, submission.get_key())
+        self.assertRaises(GithubException, submission.process, FakeGithub(fail='create_git_commit'), 'test/hub')
+        submission.snapshot()
+        self.assertEqual('failed', submission.status)
+        self.assertTrue(submission.resumable)
+        self.assertEqual(['branch', 'validate'], sorted(submission.steps))
+        gh = FakeGithub()
+        self.assertEqual(1, submission.process(gh, 'test/hub'))
+        self.assertNotIn('create_git_ref', gh.calls)
+        self.assertEqual('finished', submission.status)
+
+    def testCatalogListings(self):
+        hub = Hub()
+        res = hub.viewCatalog(offset=0, limit=2)
+        self.assertEqual(hub.dconn.zcard('hub:modules'), res['results'])
+        self.assertLessEqual(len(res['modules']), 2)
+        self.assertNotIn('modules', hub.dconn.jsonobjkeys('hub:catalog'))
+        self.assertIn('submissions', hub.viewSubmissions(limit=5))
+
+    def testWarmup(self):
+        import rmhub
+        rmhub.warmup()
+        self.assertIsNotNone(rmhub._hub)
+
+    def testReplicasFallBackToPrimary(self):
+        from redis import StrictRedis
+        from rmhub import Replicas
+        hub = Hub()
+        replicas = Replicas(hub.dconn, [StrictRedis(port=1)])
+        self.assertTrue(replicas.read(lambda conn: conn.ping()))
+        self.assertIs(hub.dconn, replicas.reader())
+
+    def testModulesBlob(self):
+        import json
+        import zlib
+        hub = Hub()
+        listing = json.loads(zlib.decompress(hub.viewModulesBlob(sort='name'), 16 + zlib.MAX_WBITS))
+        self.assertEqual(hub.viewModules(sort='name')['results'], listing['results'])
+        self.assertEqual([m['name'] for m in hub.viewModules(sort='name')['modules']],
+                         [m['name'] for m in listing['modules']])
+
+    def testIndexWriterWritesToRebuild(self):
+        from rmhub import RediSearchClient
+        hub = Hub()
+        client = RediSearchClient('test:ix', conn=hub.sconn.redis)
+        hub.createIndex(client)
+        hub.dconn.set('hub:index:building', 'test:ix')
+        try:
+            hub.indexWriter().add_document('test/module', nosave=True, replace=True,
+                                           name='test', description='writes during rebuilds')
+        finally:
+            hub.dconn.delete('hub:index:building')
+        self.assertIn('test/module', hub.dconn.smembers('hub:index:dirty'))
+        self.assertEqual(1, client.search('rebuilds').total)
+        hub.indexWriter().delete_document('test/module')
+        client.drop_index()
+        hub.dconn.delete('hub:index:dirty')
@@ -2,20 +2,33 @@ import json
 import os
 import re
 import sys
+import threading
+import zlib
 import markdown
 import StringIO
 import validators
 
-from flask import (Flask, abort, flash, g, jsonify, redirect, render_template,
+from flask import (Flask, Response, abort, flash, g, jsonify, redirect, render_template,
                    request, session, url_for, Markup)
 from flask_bootstrap import Bootstrap
 from flask_cache import Cache
-from rmhub import Hub, GithubRepository, GithubAuthor, logger
+from rmhub import Hub, GithubRepository, GithubAuthor, logger, metrics
 
 hub = None
 
+# Set once the worker is warmed up and ready to serve
+ready = threading.Event()
+_warmup_lock = threading.Lock()
+
+# Rendered markdown pages by topic, and their files' modification times
+MARKDOWN_PATH = '{}/static/markdown'.format(os.path.dirname(os.path.realpath(__file__)))
+moar_pages = {}
+
+MAX_PAGE_SIZE = 1000   # the size of the hub's listing blobs
+READ_YOUR_WRITES = 10*60     # seconds submitters read their submission from the primary
+
 cache = Cache(config={
-    'CACHE_TYPE': 'redis',
+    'CACHE_TYPE': 'rmhub.web.cache.tracked_redis',
     'CACHE_KEY_PREFIX': 'webcache:',
     'CACHE_REDIS_URL': os.environ['CACHE_REDIS_URL'],
 })
@@ -24,14 +37,68 @@ app = Flask(__name__)
 cache.init_app(app)
 Bootstrap(app)
 
-@app.before_first_request
-def startTheWebz():
-    logger.info('Starting the webz')
+def warmup():
+    """
+    Prepares the worker before it serves requests: connects the hub, clears
+    the cache and preloads the rendered pages, the default listing and the
+    suggestions. Called in the background when the worker boots, and by the
+    first request if it comes in earlier.
+    """
     global hub
-    hub = Hub()
-    # DANGER: Flask-Cache's Redis.clear() uses `KEYS`
-    # TODO: a) an urgent PR to change it to `SCAN` when supported, b) another FR to use a set to keep track of keys c) use `UNLINK` instead of `DEL` if possible
-    cache.clear()
+    with _warmup_lock:
+        if ready.is_set():
+            return
+        logger.info('Warming up the webz')
+        start = metrics.clock()
+        hub = Hub()
+        hub.warmup()
+        # The tracked cache sweeps its own keys with `ZSCAN` and `UNLINK`
+        cache.clear()
+        load_moar_pages()
+        hub.viewModulesBlob()
+        hub.viewSuggestionsSnapshot()
+        ready.set()
+        logger.info('Webz warmed up in {:.3f}ms'.format((metrics.clock() - start) * 1000.0))
+
+@app.before_request
+def startTheWebz():
+    # Readiness probes don't wait for the warm-up
+    if not ready.is_set() and request.endpoint != 'handle_ready':
+        logger.info('Starting the webz')
+        warmup()
+
+@app.before_request
+def start_metrics():
+    metrics.start()
+
+@app.after_request
+def stop_metrics(response):
+    unit = metrics.stop(request.endpoint or 'unknown')
+    if unit is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(unit)
+    return response
+
+@app.teardown_request
+def discard_metrics(exc):
+    # Requests that raised skip after_request, end their unit of work anyway
+    metrics.stop(request.endpoint or 'unknown')
+
+def load_moar_pages():
+    """
+    Renders the markdown pages served by /moar, skipping unchanged files
+    """
+    for filename in os.listdir(MARKDOWN_PATH):
+        if not filename.endswith('.md'):
+            continue
+        full_path = '{}/{}'.format(MARKDOWN_PATH, filename)
+        mtime = os.path.getmtime(full_path)
+        topic = filename[:-len('.md')]
+        if topic in moar_pages and moar_pages[topic][0] == mtime:
+            continue
+        md = StringIO.StringIO()
+        markdown.markdownFromFile(input=full_path, output=md)
+        moar_pages[topic] = (mtime, Markup(md.getvalue()))
+        md.close()
 
 @app.route('/')
 @cache.cached(timeout=0)
@@ -40,28 +107,52 @@ def handle_homepage():
     return render_template('index.html', repo_url=repo_url)
 
 @app.route('/moar/<string:topic>')
-@cache.cached(timeout=0)
 def handle_moar(topic):
+    # Pages are served from memory, only known topics are looked up
+    if app.debug:
+        load_moar_pages()
     topic = str(topic)
-    filename = topic.lower().replace(' ', '_')
     label = 'modal{}Label'.format(topic.replace(' ', ''))
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    full_path = '{}/static/markdown/{}.md'.format(dir_path, filename)
-    if os.path.isfile(full_path):
-        md = StringIO.StringIO()
-        markdown.markdownFromFile(input=full_path, output=md)
-        moar = Markup(md.getvalue())
-        md.close()
+    page = moar_pages.get(topic.lower().replace(' ', '_'))
+    if page:
+        moar = page[1]
     else:
         moar = "That's odd, there doesn't seem to be anything moar about {}".format(topic)
     return render_template('moar.html', label=label, topic=topic, moar=moar)
 
+def listing_args(page=0):
+    """
+    Parses the paging and projection arguments of a modules listing request
+    """
+    limit = min(request.args.get('limit', MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    limit = max(limit, 1)
+    offset = max(request.args.get('offset', page * limit, type=int), 0)
+    fields = request.args.get('fields')
+    if fields:
+        fields = [f for f in fields.split(',') if re.match('^\w+$', f)]
+    return {
+        'offset': offset,
+        'limit': limit,
+        'fields': fields or None,
+    }
+
 @app.route('/modules')
 @app.route('/modules/<int:page>')
 def handle_modules(page=0):
-    # TODO: paging
     sort = request.cookies.get('sort')
-    return jsonify(hub.viewModules(sort=sort))
+    args = listing_args(page)
+    if args['offset'] or args['fields'] or args['limit'] < MAX_PAGE_SIZE:
+        return jsonify(hub.viewModules(sort=sort, **args))
+
+    # The first full page is served from its pre-assembled, gzipped blob
+    blob = hub.viewModulesBlob(sort=sort)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = app.response_class(blob, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = app.response_class(zlib.decompress(blob, 16 + zlib.MAX_WBITS), mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 @app.route('/search')
@@ -69,9 +160,19 @@ def handle_search():
     # TODO: santize/safeguard query
     query = request.args.get('q', '')
     sort = request.cookies.get('sort')
-    results = hub.viewModules(query=query, sort=sort)
+    results = hub.viewModules(query=query, sort=sort, **listing_args())
     return jsonify(results)
 
+@app.route('/catalog')
+def handle_catalog():
+    args = listing_args()
+    return jsonify(hub.viewCatalog(args['offset'], args['limit']))
+
+@app.route('/submissions')
+def handle_submissions():
+    args = listing_args()
+    return jsonify(hub.viewSubmissions(args['offset'], args['limit']))
+
 @app.route('/submit', methods=['GET', 'POST'])
 def handle_submit():
     if request.method == 'POST':
@@ -122,24 +223,83 @@ def handle_submit():
 
         # TODO: add more types of repos/authors/icon upload
         status = hub.submitModule(repo_id, **kwargs)
-        return jsonify(status)
+        response = jsonify(status)
+        # Read the submitter's own writes from the primary for a while
+        response.set_cookie('submitted', repo_id, max_age=READ_YOUR_WRITES)
+        return response
     elif request.method == 'GET':
         repo_id = request.args['id']
-        status = hub.viewSubmissionStatus(repo_id)
+        primary = request.cookies.get('submitted') == repo_id
+        status = hub.viewSubmissionStatus(repo_id, primary=primary)
         if status:
             return jsonify(status)
         else:
             return 'Submission not found', 404
 
+@app.route('/submit/events')
+def handle_submit_events():
+    # Server-Sent Events of a submission's progress, replacing polling
+    repo_id = request.args['id']
+    statuses = hub.followSubmissionStatus(repo_id)
+    first = next(statuses, None)
+    if first is None:
+        return 'Submission not found', 404
+
+    def stream():
+        yield 'retry: 2000\n\ndata: {}\n\n'.format(json.dumps(first))
+        for status in statuses:
+            if status is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield 'data: {}\n\n'.format(json.dumps(status))
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/sugget')
 @app.route('/sugget/')
 @app.route('/sugget/<string:query>')
 def handle_suggetions(query=None):
     # TODO: sanitize query
     if query:
-        return jsonify(hub.viewSearchSuggestions(query))
+        num = min(max(request.args.get('num', 10, type=int), 1), 50)
+        # Fuzzy matching of short prefixes can scan the entire dictionary
+        fuzzy = request.args.get('fuzzy') == '1' and len(query) > 2
+        return jsonify(hub.viewSearchSuggestions(query, num=num, fuzzy=fuzzy))
     else:
         return jsonify([])
 
+@app.route('/suggestions')
+def handle_suggestions_snapshot():
+    version, terms = hub.viewSuggestionsSnapshot()
+    response = jsonify({
+        'version': version,
+        'terms': terms,
+    })
+    # Clients revalidate their copy with the version as the ETag
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/ready')
+def handle_ready():
+    # Lets load balancers hold traffic back from cold workers
+    if ready.is_set():
+        return jsonify({'ready': True})
+    return jsonify({'ready': False}), 503
+
+@app.route('/metrics')
+def handle_metrics():
+    # Requests are this process' totals, jobs are all workers'
+    return jsonify({
+        'requests': metrics.totals(),
+        'jobs': metrics.load(hub.qconn),
+        'cache': cache.cache.stats(),
+        'github': hub.ghcache.stats() if hub.ghcache else None,
+        'github_quota': hub.ghpool.quotas(),
+    })
+
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    app.run()
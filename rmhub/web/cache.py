@@ -0,0 +1,115 @@
+import time
+import uuid
+
+from redis import ResponseError
+from redis import from_url as redis_from_url
+from werkzeug.contrib.cache import RedisCache
+
+
+class TrackedRedisCache(RedisCache):
+    """
+    A Redis cache that keeps track of its keys in a sorted set by when they
+    expire, so clearing it doesn't need `KEYS` and doesn't block the server
+    while it is swept. Expired keys are pruned from the set as new ones are
+    tracked. It also counts its hits and misses.
+    """
+
+    def __init__(self, *args, **kwargs):
+        RedisCache.__init__(self, *args, **kwargs)
+        self._keys = '{}:tracked'.format(self.key_prefix)
+        self.hits = 0
+        self.misses = 0
+
+    def _track(self, timeout, *keys):
+        if not keys:
+            return
+        if timeout is None:
+            timeout = self.default_timeout
+        now = time.time()
+        expires = now + timeout if timeout else float('inf')
+        pipe = self._client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self._keys, '-inf', now)
+        pipe.zadd(self._keys, **dict((key, expires) for key in keys))
+        pipe.execute()
+
+    def _unlink(self, *keys):
+        try:
+            return self._client.execute_command('UNLINK', *keys)
+        except ResponseError:   # pre-4.0 Redis
+            return self._client.delete(*keys)
+
+    def get(self, key):
+        value = RedisCache.get(self, key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        res = RedisCache.set(self, key, value, timeout)
+        self._track(timeout, key)
+        return res
+
+    def add(self, key, value, timeout=None):
+        res = RedisCache.add(self, key, value, timeout)
+        if res:
+            self._track(timeout, key)
+        return res
+
+    def set_many(self, mapping, timeout=None):
+        res = RedisCache.set_many(self, mapping, timeout)
+        self._track(timeout, *mapping.keys())
+        return res
+
+    def delete(self, key):
+        self._client.zrem(self._keys, key)
+        return RedisCache.delete(self, key)
+
+    def delete_many(self, *keys):
+        if keys:
+            self._client.zrem(self._keys, *keys)
+        return RedisCache.delete_many(self, *keys)
+
+    def clear(self, count=100):
+        # Move the tracked keys aside so new ones aren't swept with them
+        sweep = '{}:sweep:{}'.format(self._keys, uuid.uuid4().hex)
+        try:
+            self._client.rename(self._keys, sweep)
+        except ResponseError:   # no keys
+            return True
+
+        keys = (key for key, _ in self._client.zscan_iter(sweep, count=count))
+        for chunk in _chunks(keys, count):
+            self._unlink(*[self.key_prefix + key for key in chunk])
+        self._unlink(sweep)
+        return True
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self._client.zcard(self._keys),
+        }
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def tracked_redis(app, config, args, kwargs):
+    """
+    Flask-Cache factory of the tracked Redis cache
+    """
+    kwargs.update(dict(
+        host=redis_from_url(config['CACHE_REDIS_URL']),
+        key_prefix=config.get('CACHE_KEY_PREFIX'),
+    ))
+    return TrackedRedisCache(*args, **kwargs)
@@ -228,6 +228,33 @@ function submitModulePoll(data) {
     }
 }
 
+// Follows the submission's progress as it is pushed by the server, falling
+// back to polling where Server-Sent Events aren't available
+function submitModuleFollow(data) {
+    if ('failed' == data.status || 'finished' == data.status || !window.EventSource) {
+        return submitModulePoll(data);
+    }
+    $( "#submitProgress .progress-bar" )
+        .text(data.message + '...');
+    var source = new EventSource('submit/events?id=' + encodeURIComponent(data.id));
+    source.onmessage = function(e) {
+        var status = JSON.parse(e.data);
+        if ('failed' == status.status || 'finished' == status.status) {
+            source.close();
+            submitModulePoll(status);
+        } else {
+            $( "#submitProgress .progress-bar" )
+                .text(status.message + '...');
+        }
+    };
+    source.onerror = function() {
+        // The browser reconnects ended streams, unless it has given up
+        if (EventSource.CLOSED == source.readyState) {
+            submitModulePoll(data);
+        }
+    };
+}
+
 function submitModule(e) {
     e.stopPropagation();
     if (e.isDefaultPrevented()) {
@@ -242,7 +269,7 @@ function submitModule(e) {
             type: "POST",
             url: "submit",
             data: $(this).serialize(),
-            success: submitModulePoll,
+            success: submitModuleFollow,
             error: submitModuleError
         });
     }
@@ -0,0 +1,17 @@
+"""
+The hub's RQ worker, run with `rq worker --worker-class rmhub.worker.Worker`
+"""
+from rq.worker import SimpleWorker
+
+import rmhub
+
+
+class Worker(SimpleWorker):
+    """
+    Runs jobs in the worker's process, so they share its hub and connections,
+    which are warmed up before the first job is taken
+    """
+
+    def work(self, *args, **kwargs):
+        rmhub.warmup()
+        return SimpleWorker.work(self, *args, **kwargs)
@@ -11,6 +11,7 @@ setup(
     include_package_data=True,
     setup_requires=['nose>=1.0'],
     install_requires=[
+        'monotonic',
         'python-dotenv',
         'redis',
         'redisearch',
@@ -28,6 +29,12 @@ setup(
             'validators',
         ],
     },
+    entry_points={
+        'console_scripts': [
+            'rmhub-snapshot = rmhub.snapshot:main',
+            'rmhub-manage = rmhub.manage:main',
+        ],
+    },
     test_suite='nose.collector',
     tests_require=['nose'],
 )
\ No newline at end of file